@@ -1,135 +1,117 @@
 """
 CPS Wisdom Bot - Optimized Voice Agent
-- Redis caching for faster repeated queries
+- Two-tier caching (in-process + async Redis) for faster repeated queries
 - Optimized VAD (0.5s instead of 0.8s)
 - Pre-call feedback for better UX
+- Speculative retrieval on interim STT transcripts
+- Cached TTS audio for fixed phrases and repeated sentences
+- Per-stage latency metrics (Prometheus) on AGENT_METRICS_PORT
+- Prewarmed worker processes: VAD and plugin clients load before a caller arrives
+- Explicit dispatch into per-session rooms, with load-aware worker selection
 """
 
 import asyncio
-import hashlib
-import json
+import os
+import time
 from dotenv import load_dotenv
-from livekit.agents import JobContext, WorkerOptions, cli, Agent, function_tool, RunContext
-from livekit.agents.voice import AgentSession
+from livekit.agents import JobContext, JobProcess, WorkerOptions, cli, Agent, function_tool, RunContext
+from livekit.agents.voice import AgentSession, room_io
 from livekit.plugins import openai, silero, google
-import httpx
 from typing import Optional
 
-# Optional Redis import - agent works without it (just no caching)
-try:
-    import redis
-    REDIS_AVAILABLE = True
-except ImportError:
-    REDIS_AVAILABLE = False
-    print("⚠️ Redis not installed. Caching disabled. Install with: pip install redis")
-
+# Load .env before local modules read their configuration
 load_dotenv()
 
-# Redis connection for caching
-redis_client = None
+from lightrag_client import close_client, LightRAGError
+from cache import close_redis
+from answers import MODES, VOICE_HEDGE_AFTER, VOICE_MODE, answer_cache, get_answer, get_answer_hedged, seed_query_index
+from local_index import load_local_index
+from condense import condense
+from speculative import SpeculativeSearch
+from tts_cache import CachedTTS
+from rooms import AGENT_LOAD_THRESHOLD, AGENT_NAME, worker_load
+from metrics import (
+    AGENT_METRICS_DIR, AGENT_METRICS_PORT, AGENT_STARTUP, REQUESTS_INFLIGHT, VOICE_STAGE, observe_voice_turn,
+)
 
-def get_redis_client():
-    """Get or create Redis client for caching"""
-    global redis_client
-    if not REDIS_AVAILABLE:
-        return None
-    
-    if redis_client is None:
-        try:
-            redis_client = redis.Redis(
-                host='127.0.0.1',
-                port=6380,  # LiveKit's Redis
-                db=0,
-                decode_responses=True,
-                socket_connect_timeout=2
-            )
-            redis_client.ping()
-            print("✅ Redis connected for caching")
-        except Exception as e:
-            print(f"⚠️ Redis connection failed: {e}. Caching disabled.")
-            redis_client = None
-    return redis_client
-
-def get_cache_key(query: str) -> str:
-    """Generate cache key from query"""
-    return f"lightrag:query:{hashlib.md5(query.lower().strip().encode()).hexdigest()}"
-
-async def query_lightrag_cached(query: str, mode: str = "naive") -> dict:
+answer_cache.verbose = True
+
+# Warm job processes kept ready for new callers (each has already run prewarm)
+AGENT_IDLE_PROCESSES = int(os.getenv("AGENT_IDLE_PROCESSES", "2"))
+
+async def query_lightrag_cached(query: str, mode: str = VOICE_MODE, budget: float = VOICE_HEDGE_AFTER) -> dict:
     """
-    Query LightRAG with Redis caching
-    Returns cached result if available, otherwise queries LightRAG
+    Query LightRAG through the shared answer cache
+    Returns cached result if available (stale entries refresh in the background;
+    text-chat answers for the same question are reused), otherwise queries LightRAG.
+    Past `budget` seconds, local book passages are returned instead of waiting
     """
-    cache_key = get_cache_key(query)
-    redis_cli = get_redis_client()
-    
-    # Try to get from cache
-    if redis_cli:
-        try:
-            cached = redis_cli.get(cache_key)
-            if cached:
-                print(f"✅ Cache HIT: {query[:50]}...")
-                return json.loads(cached)
-        except Exception as e:
-            print(f"⚠️ Cache read error: {e}")
-    
-    # Query LightRAG
-    print(f"🔍 Cache MISS - querying LightRAG: {query[:50]}...")
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(
-                "http://127.0.0.1:9621/query",
-                json={"query": query, "mode": mode}
-            )
-            if resp.status_code == 200:
-                result = resp.json()
-                
-                # Cache the result (TTL: 1 hour)
-                if redis_cli:
-                    try:
-                        redis_cli.setex(
-                            cache_key,
-                            3600,  # 1 hour TTL
-                            json.dumps(result)
-                        )
-                        print(f"💾 Cached result for: {query[:50]}...")
-                    except Exception as e:
-                        print(f"⚠️ Cache write error: {e}")
-                
-                return result
-            else:
-                return {"response": "Error querying knowledge base."}
-    except Exception as e:
+        return await get_answer_hedged(query, mode, timeout=30.0, budget=budget, fallback_modes=MODES)
+    except LightRAGError as e:
         print(f"❌ LightRAG query error: {e}")
         return {"response": "Search unavailable."}
 
+async def search_speculatively(query: str) -> dict:
+    """
+    Unhedged lookup for SpeculativeSearch: cancelling a replaced speculation
+    cancels its LightRAG call too (unless another caller shares it)
+    """
+    return await get_answer(query, VOICE_MODE, timeout=30.0, fallback_modes=MODES)
+
 @function_tool
 async def search_knowledge(context: RunContext, question: str):
     """
     Search Islamic wisdom from Maulana Wahiduddin Khan's books.
     Use this tool to find information about peace, spirituality, and Islamic teachings.
     """
-    # Query with caching
-    result = await query_lightrag_cached(question, mode="naive")
+    start = time.perf_counter()
+    with REQUESTS_INFLIGHT.labels("search_knowledge").track_inprogress():
+        # Reuse the search started from the user's interim transcript if it matches;
+        # the latency budget for local passages counts from the tool call either way
+        result = None
+        if isinstance(context.userdata, SpeculativeSearch):
+            result = await context.userdata.take(question, timeout=VOICE_HEDGE_AFTER)
+        if result is None:
+            result = await query_lightrag_cached(
+                question, budget=max(0.0, VOICE_HEDGE_AFTER - (time.perf_counter() - start)))
+    VOICE_STAGE.labels("tool_call").observe(time.perf_counter() - start)
     
-    # Extract and format response
-    response_text = result.get("response", "")
-    if response_text:
-        # Clean up response - remove markdown headers, bullets, short lines
-        lines = [
-            l.strip() 
-            for l in response_text.split('\n') 
-            if l.strip() 
-            and not l.startswith('#') 
-            and not l.startswith('-') 
-            and len(l.strip()) > 20
-        ]
-        # Return first 4 meaningful lines, max 600 chars
-        formatted = ' '.join(lines[:4])[:600]
-        return formatted if formatted else "Not found."
-    return "Not found."
+    # Keep only the sentences that answer the question, within a token budget
+    condensed = condense(result.get("response", ""), question)
+    return condensed if condensed else "Not found."
+
+def prewarm(proc: JobProcess):
+    """
+    Runs once per worker process, before it is given a job: loads the VAD model
+    and builds the plugin clients so callers don't wait for them on connect
+    """
+    start = time.perf_counter()
+    # OPTIMIZED: Faster VAD (0.5s instead of 0.8s) for quicker response
+    proc.userdata["vad"] = silero.VAD.load(min_silence_duration=0.5)  # Reduced from 0.8s (37.5% faster)
+    proc.userdata["stt"] = openai.STT(use_realtime=True)  # streaming STT: interim transcripts feed speculation
+    proc.userdata["llm"] = google.LLM(model="gemini-3-flash-preview")
+    # OPTIMIZED: Fixed phrases and repeated sentences play from cached audio
+    cached_tts = CachedTTS(openai.TTS(voice="nova"), voice="nova")
+    cached_tts.preload()
+    proc.userdata["tts"] = cached_tts
+    # Fallback passages for slow LightRAG answers (the server builds the index)
+    load_local_index()
+    elapsed = time.perf_counter() - start
+    AGENT_STARTUP.labels("prewarm").observe(elapsed)
+    print(f"🔥 Worker process prewarmed in {elapsed:.2f}s")
 
 async def entrypoint(ctx: JobContext):
-    await ctx.connect()
+    start = time.perf_counter()
+    ctx.add_shutdown_callback(close_client)
+    ctx.add_shutdown_callback(close_redis)
+
+    warm = ctx.proc.userdata
+    stt, llm, cached_tts = warm["stt"], warm["llm"], warm["tts"]
+    # Open plugin connections while we join the room
+    for plugin in (stt, llm, cached_tts):
+        plugin.prewarm()
+    await asyncio.gather(ctx.connect(), seed_query_index())
     
     agent = Agent(
         instructions="""CPS Wisdom Bot. Source: Maulana Wahiduddin Khan's books.
@@ -144,19 +126,50 @@ RULES:
         tools=[search_knowledge],
     )
     
-    # OPTIMIZED: Faster VAD (0.5s instead of 0.8s) for quicker response
+    # OPTIMIZED: Retrieval starts on stable interim transcripts, off the critical path
+    speculative = SpeculativeSearch(search_speculatively)
+    ctx.add_shutdown_callback(speculative.aclose)
+
+    # Only phrases that weren't on disk at prewarm still need rendering
+    prerender = asyncio.create_task(cached_tts.prerender())
+
+    async def stop_prerender():
+        # A half-finished pre-render must not outlive the job
+        prerender.cancel()
+
+    ctx.add_shutdown_callback(stop_prerender)
+
     session = AgentSession(
-        vad=silero.VAD.load(min_silence_duration=0.5),  # Reduced from 0.8s (37.5% faster)
-        stt=openai.STT(),
-        llm=google.LLM(model="gemini-3-flash-preview"),
-        tts=openai.TTS(voice="nova"),
+        vad=warm["vad"],
+        stt=stt,
+        llm=llm,
+        tts=cached_tts,
+        userdata=speculative,
     )
+    session.on("user_input_transcribed", lambda ev: speculative.on_transcript(ev.transcript, ev.is_final))
+    # Per-turn stage latencies: end of turn, STT final, LLM first token, TTS first byte
+    session.on("conversation_item_added", lambda ev: observe_voice_turn(ev.item))
     
     # Start the session
-    await session.start(agent=agent, room=ctx.room)
+    # The room belongs to this one conversation: remove it when the caller leaves
+    await session.start(agent=agent, room=ctx.room, room_options=room_io.RoomOptions(delete_room_on_close=True))
+    elapsed = time.perf_counter() - start
+    AGENT_STARTUP.labels("job_start").observe(elapsed)
+    print(f"🚀 Session live {elapsed:.2f}s after job start")
     
     # Wait indefinitely
     await asyncio.Event().wait()
 
 if __name__ == "__main__":
-    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint))
+    cli.run_app(WorkerOptions(
+        entrypoint_fnc=entrypoint,
+        prewarm_fnc=prewarm,
+        num_idle_processes=AGENT_IDLE_PROCESSES,
+        # Only dispatched explicitly, by the tokens /voice/token mints
+        agent_name=AGENT_NAME,
+        load_fnc=worker_load,
+        load_threshold=AGENT_LOAD_THRESHOLD,
+        # Metrics from every job process, served by the worker at :AGENT_METRICS_PORT/metrics
+        prometheus_port=AGENT_METRICS_PORT,
+        prometheus_multiproc_dir=AGENT_METRICS_DIR,
+    ))
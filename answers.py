@@ -0,0 +1,179 @@
+"""
+CPS Wisdom Bot - Shared Answer Store
+- One cache namespace for text chat, voice agent and the warming job:
+  lightrag:<corpus version>:<mode>:<md5 of canonical question>
+- One value schema: {"response": raw text, "html": rendered, "fmt": catalogue version}
+- Canonical questions are shared through Redis (oldest first, capped) so every process
+  matches paraphrases alike
+- Hedged answers: local book passages if LightRAG misses its latency budget
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from typing import Optional
+
+from cache import AnswerCache, get_redis, mark_redis_down
+from formatter import FORMAT_VERSION, format_response
+from lightrag_client import LightRAGError, LightRAGRejected, query_lightrag
+from local_index import local_answer
+from metrics import LOCAL_FALLBACK
+from query_match import QueryIndex
+
+# Bump after re-indexing the books: old answers are simply never read again
+CORPUS_VERSION = os.getenv("CORPUS_VERSION", "1")
+
+TEXT_MODE = os.getenv("TEXT_MODE", "mix")
+VOICE_MODE = os.getenv("VOICE_MODE", "naive")
+MODES = tuple(dict.fromkeys((TEXT_MODE, VOICE_MODE)))
+
+# Serve local book passages if LightRAG hasn't answered within these budgets
+TEXT_HEDGE_AFTER = float(os.getenv("TEXT_HEDGE_AFTER_MS", "4000")) / 1000
+VOICE_HEDGE_AFTER = float(os.getenv("VOICE_HEDGE_AFTER_MS", "2500")) / 1000
+
+KEY_PREFIX = f"lightrag:{CORPUS_VERSION}"
+# Canonical questions scored by first-seen time; the oldest are dropped past QUESTIONS_MAX
+QUESTIONS_KEY = f"{KEY_PREFIX}:questions:seen"
+
+# Two-tier cache (in-process LRU + async Redis) with stale-while-revalidate
+answer_cache = AnswerCache(namespace=KEY_PREFIX)
+
+# Paraphrases of earlier questions map onto the same cache key
+query_index = QueryIndex()
+QUESTIONS_MAX = query_index.max_entries
+
+
+def cache_key(canonical: str, mode: str) -> str:
+    return f"{KEY_PREFIX}:{mode}:{hashlib.md5(canonical.encode()).hexdigest()}"
+
+
+def cache_value(raw: str) -> dict:
+    """Raw answer plus its rendered HTML, so cache hits skip formatting"""
+    return {"response": raw, "html": format_response(raw), "fmt": FORMAT_VERSION}
+
+
+def rendered(value: dict) -> str:
+    """Cached HTML if it was rendered with the current book catalogue"""
+    if value.get("fmt") == FORMAT_VERSION and "html" in value:
+        return value["html"]
+    return format_response(value["response"])
+
+
+async def remember_question(canonical: str):
+    """Publish a canonical question so other processes seed their index with it"""
+    redis_cli = await get_redis()
+    if redis_cli is None:
+        return
+    try:
+        async with redis_cli.pipeline(transaction=False) as pipe:
+            pipe.zadd(QUESTIONS_KEY, {canonical: time.time()}, nx=True)  # keeps the first-seen time
+            pipe.zremrangebyrank(QUESTIONS_KEY, 0, -QUESTIONS_MAX - 1)
+            pipe.expire(QUESTIONS_KEY, answer_cache.fresh_ttl + answer_cache.stale_ttl)
+            await pipe.execute()
+    except Exception as e:
+        mark_redis_down(e)
+
+
+_seeded = False
+
+
+async def seed_query_index() -> int:
+    """
+    Load canonical questions published by other processes (once per process),
+    oldest first: near-duplicates then resolve to the same canonical everywhere
+    """
+    global _seeded
+    if _seeded:
+        return len(query_index)
+    redis_cli = await get_redis()
+    if redis_cli is None:
+        return 0
+    try:
+        questions = await redis_cli.zrange(QUESTIONS_KEY, 0, -1)
+    except Exception as e:
+        mark_redis_down(e)
+        return 0
+    for canonical in questions or ():
+        query_index.canonicalize(canonical.decode("utf-8"))
+    _seeded = True
+    return len(query_index)
+
+
+async def fetch_answer(query: str, mode: str, timeout: float = 60.0,
+                       canonical: str = None) -> dict:
+    """Query LightRAG and build the shared cache value"""
+    result = await query_lightrag(query, mode=mode, timeout=timeout)
+    if canonical is not None:
+        await remember_question(canonical)
+    return cache_value(result.get("response", "No answer."))
+
+
+async def get_answer(query: str, mode: str, timeout: float = 60.0, fallback_modes=()) -> dict:
+    """
+    Cached answer for `query` in `mode`, querying LightRAG on a miss.
+    Fresh answers cached under `fallback_modes` are accepted before going upstream.
+    Raises LightRAGError if LightRAG has to be queried and fails, or if another
+    caller's query for the same question doesn't finish within `timeout`.
+    """
+    canonical = query_index.canonicalize(query)
+    try:
+        return await answer_cache.get_or_fetch(
+            cache_key(canonical, mode),
+            lambda: fetch_answer(query, mode, timeout, canonical),
+            label=f"{query[:50]}...",
+            fallback_keys=[cache_key(canonical, m) for m in fallback_modes if m != mode],
+            timeout=timeout,
+        )
+    except TimeoutError as e:
+        raise LightRAGError(f"LightRAG answer not ready after {timeout:.1f}s: {e}") from e
+
+
+# LightRAG calls still running after a hedged answer was served (they fill the cache)
+_background: set = set()
+
+
+def _finished(task: asyncio.Task):
+    _background.discard(task)
+    if not task.cancelled():
+        task.exception()  # retrieved: a failed background call is not an error to report
+
+
+def local_value(query: str) -> Optional[dict]:
+    """Cache-schema value built from local book passages (never cached), or None"""
+    text = local_answer(query)
+    if text is None:
+        return None
+    value = cache_value(text)
+    value["source"] = "local"
+    return value
+
+
+async def get_answer_hedged(query: str, mode: str, timeout: float = 60.0,
+                            budget: float = TEXT_HEDGE_AFTER, fallback_modes=()) -> dict:
+    """
+    get_answer with a latency budget: if LightRAG hasn't answered within `budget`
+    seconds, fails, or is rejected by the upstream guard, the best local book passages
+    are served instead. The LightRAG call keeps running and caches its answer for the next ask.
+    Raises LightRAGError only if LightRAG fails and nothing local matches.
+    """
+    task = asyncio.ensure_future(get_answer(query, mode, timeout, fallback_modes))
+    task.add_done_callback(_finished)
+    _background.add(task)
+    done, _ = await asyncio.wait({task}, timeout=budget)
+    if done:
+        try:
+            return task.result()
+        except LightRAGError as e:
+            value = local_value(query)
+            if value is None:
+                raise
+            LOCAL_FALLBACK.labels("rejected" if isinstance(e, LightRAGRejected) else "error").inc()
+            return value
+
+    value = local_value(query)
+    if value is None:
+        return await task
+    LOCAL_FALLBACK.labels("budget").inc()
+    print(f"⏱️ LightRAG over {budget:.1f}s budget, serving local passages: {query[:50]}...")
+    return value
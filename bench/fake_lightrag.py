@@ -0,0 +1,124 @@
+"""
+Local LightRAG stand-in for benchmarks.
+- POST /query          {"query", "mode"} -> {"response"} after a simulated delay
+- POST /query/stream   NDJSON {"response": chunk} lines, first chunk after the same delay
+Latency is log-normal around --latency (seconds) so p99 is realistic, and
+answers are deterministic per query so cached and fresh answers compare equal.
+
+Usage:
+    python -m bench.fake_lightrag --port 9621 --latency 1.5 --jitter 0.3
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+
+BOOKS = ["The Age of Peace", "Purpose of Life", "Creation Plan of God", "Islam and Peace"]
+
+
+class Upstream:
+    def __init__(self, latency: float = 1.5, jitter: float = 0.3, chunk_delay: float = 0.02,
+                 error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_delay = chunk_delay
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.inflight = 0
+        self.max_inflight = 0
+
+    def delay(self) -> float:
+        if self.latency <= 0:
+            return 0.0
+        return self.rng.lognormvariate(0, self.jitter) * self.latency if self.jitter else self.latency
+
+    def answer(self, query: str, mode: str) -> str:
+        digest = hashlib.md5(f"{mode}|{query}".encode()).hexdigest()
+        book = BOOKS[int(digest[:2], 16) % len(BOOKS)]
+        return (
+            f"### On {query.strip('?')}\n\n"
+            f"**Maulana Wahiduddin Khan** explains this in {book} [{int(digest[2:4], 16) % 9 + 1}].\n\n"
+            f"- Peace is the first principle ({digest[:8]}).\n"
+            f"- Patience turns problems into opportunities.\n\n"
+            f"Reflection and positive thinking follow from it, as in {book}."
+        )
+
+
+def create_app(upstream: Upstream) -> FastAPI:
+    app = FastAPI()
+    app.state.upstream = upstream
+
+    async def _begin(data: dict):
+        upstream.calls += 1
+        upstream.inflight += 1
+        upstream.max_inflight = max(upstream.max_inflight, upstream.inflight)
+        await asyncio.sleep(upstream.delay())
+        return upstream.rng.random() >= upstream.error_rate
+
+    @app.post("/query")
+    async def query(data: dict):
+        try:
+            if not await _begin(data):
+                return JSONResponse({"detail": "simulated failure"}, status_code=500)
+            return {"response": upstream.answer(data.get("query", ""), data.get("mode", "mix"))}
+        finally:
+            upstream.inflight -= 1
+
+    @app.post("/query/stream")
+    async def query_stream(data: dict):
+        async def lines():
+            try:
+                if not await _begin(data):
+                    yield json.dumps({"error": "simulated failure"}) + "\n"
+                    return
+                text = upstream.answer(data.get("query", ""), data.get("mode", "mix"))
+                words = text.split(" ")
+                for i in range(0, len(words), 4):
+                    chunk = " ".join(words[i:i + 4]) + (" " if i + 4 < len(words) else "")
+                    yield json.dumps({"response": chunk}) + "\n"
+                    await asyncio.sleep(upstream.chunk_delay)
+            finally:
+                upstream.inflight -= 1
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    @app.get("/stats")
+    async def stats():
+        return {"calls": upstream.calls, "inflight": upstream.inflight, "max_inflight": upstream.max_inflight}
+
+    @app.post("/stats/reset")
+    async def reset():
+        upstream.calls = upstream.max_inflight = 0
+        return {"ok": True}
+
+    return app
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=1.5, help="median answer latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.3, help="log-normal sigma (0 = fixed)")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="delay between streamed chunks (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests that fail")
+
+
+def upstream_from_args(args) -> Upstream:
+    return Upstream(args.latency, args.jitter, args.chunk_delay, args.error_rate, args.seed)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="LightRAG stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9621)
+    parser.add_argument("--seed", type=int, default=0)
+    add_arguments(parser)
+    args = parser.parse_args()
+    print(f"🧪 Fake LightRAG on {args.host}:{args.port} (latency {args.latency}s)")
+    uvicorn.run(create_app(upstream_from_args(args)), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,336 @@
+"""
+In-memory Redis stand-in for benchmarks (RESP2/RESP3 over TCP).
+Implements the commands the bot uses; not for production.
+
+Usage:
+    python -m bench.fake_redis --port 6380
+"""
+
+import argparse
+import asyncio
+import fnmatch
+import random
+import time
+
+
+class _ZSet(dict):
+    """Sorted set: member -> score (sorted on read; fine at benchmark sizes)"""
+
+
+class _ScorePairs(list):
+    """(member, score) reply: pairs of doubles in RESP3, a flat list in RESP2"""
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data: dict = {}
+        self.expires: dict = {}  # key -> monotonic deadline
+
+    # --- expiry ---
+
+    def _alive(self, key) -> bool:
+        deadline = self.expires.get(key)
+        if deadline is not None and time.monotonic() >= deadline:
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def _set_ttl(self, key, seconds: float):
+        self.expires[key] = time.monotonic() + seconds
+
+    # --- commands (args are bytes) ---
+
+    def ping(self, *args):
+        return args[0] if args else "+PONG"
+
+    def get(self, key):
+        return self.data.get(key) if self._alive(key) else None
+
+    def set(self, key, value, *opts):
+        opts = [o.upper() for o in opts]
+        nx, xx = b"NX" in opts, b"XX" in opts
+        exists = self._alive(key)
+        if (nx and exists) or (xx and not exists):
+            return None
+        self.data[key] = value
+        self.expires.pop(key, None)
+        for i, opt in enumerate(opts):
+            if opt == b"EX":
+                self._set_ttl(key, float(opts[i + 1]))
+            elif opt == b"PX":
+                self._set_ttl(key, float(opts[i + 1]) / 1000)
+        return "+OK"
+
+    def setex(self, key, seconds, value):
+        self.set(key, value)
+        self._set_ttl(key, float(seconds))
+        return "+OK"
+
+    def delete(self, *keys):
+        n = 0
+        for key in keys:
+            if self._alive(key):
+                del self.data[key]
+                self.expires.pop(key, None)
+                n += 1
+        return n
+
+    def exists(self, *keys):
+        return sum(1 for key in keys if self._alive(key))
+
+    def expire(self, key, seconds, *opts):
+        if not self._alive(key):
+            return 0
+        self._set_ttl(key, float(seconds))
+        return 1
+
+    def pexpire(self, key, ms, *opts):
+        return self.expire(key, float(ms) / 1000)
+
+    def ttl(self, key):
+        if not self._alive(key):
+            return -2
+        deadline = self.expires.get(key)
+        return -1 if deadline is None else int(deadline - time.monotonic())
+
+    def pttl(self, key):
+        if not self._alive(key):
+            return -2
+        deadline = self.expires.get(key)
+        return -1 if deadline is None else int((deadline - time.monotonic()) * 1000)
+
+    def incr(self, key):
+        value = int(self.get(key) or 0) + 1
+        self.data[key] = str(value).encode()
+        return value
+
+    def incrby(self, key, amount):
+        value = int(self.get(key) or 0) + int(amount)
+        self.data[key] = str(value).encode()
+        return value
+
+    def _container(self, key, kind, create: bool = False):
+        value = self.data.get(key) if self._alive(key) else None
+        if not isinstance(value, kind):
+            if not create:
+                return kind()
+            value = self.data[key] = kind()
+        return value
+
+    def hset(self, key, *pairs):
+        h = self._container(key, dict, create=True)
+        added = 0
+        for field, value in zip(pairs[::2], pairs[1::2]):
+            added += field not in h
+            h[field] = value
+        return added
+
+    def hget(self, key, field):
+        return self._container(key, dict).get(field)
+
+    def hdel(self, key, *fields):
+        h = self._container(key, dict)
+        return sum(1 for f in fields if h.pop(f, None) is not None)
+
+    def hgetall(self, key):
+        return dict(self._container(key, dict))
+
+    def hincrby(self, key, field, amount):
+        h = self._container(key, dict, create=True)
+        value = int(h.get(field, 0)) + int(amount)
+        h[field] = str(value).encode()
+        return value
+
+    def zadd(self, key, *args):
+        z = self._container(key, _ZSet, create=True)
+        nx = False
+        while args and args[0].upper() in (b"NX", b"XX", b"GT", b"LT", b"CH"):
+            nx = nx or args[0].upper() == b"NX"
+            args = args[1:]
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            if nx and member in z:
+                continue
+            added += member not in z
+            z[member] = float(score)
+        return added
+
+    def zremrangebyrank(self, key, start, stop):
+        z = self._container(key, _ZSet)
+        ordered = sorted(z.items(), key=lambda kv: (kv[1], kv[0]))
+        start, stop = int(start), int(stop)
+        doomed = ordered[start:None if stop == -1 else stop + 1]
+        for member, _ in doomed:
+            del z[member]
+        return len(doomed)
+
+    def zrem(self, key, *members):
+        z = self._container(key, _ZSet)
+        return sum(1 for m in members if z.pop(m, None) is not None)
+
+    def zcard(self, key):
+        return len(self._container(key, _ZSet))
+
+    def zrange(self, key, start, stop, *opts):
+        ordered = sorted(self._container(key, _ZSet).items(), key=lambda kv: (kv[1], kv[0]))
+        start, stop = int(start), int(stop)
+        ordered = ordered[start:None if stop == -1 else stop + 1]
+        if b"WITHSCORES" in [o.upper() for o in opts]:
+            return _ScorePairs(ordered)
+        return [member for member, _ in ordered]
+
+    def sadd(self, key, *members):
+        s = self.data.get(key) if self._alive(key) else None
+        if not isinstance(s, set):
+            s = self.data[key] = set()
+        before = len(s)
+        s.update(members)
+        return len(s) - before
+
+    def smembers(self, key):
+        return list(self.data[key]) if self._alive(key) else []
+
+    def scard(self, key):
+        return len(self.data[key]) if self._alive(key) else 0
+
+    def srandmember(self, key, count=None):
+        members = self.smembers(key)
+        if count is None:
+            return random.choice(members) if members else None
+        return random.sample(members, min(int(count), len(members)))
+
+    def keys(self, pattern=b"*"):
+        pat = pattern.decode()
+        return [k for k in list(self.data) if self._alive(k) and fnmatch.fnmatchcase(k.decode(), pat)]
+
+    def dbsize(self):
+        return sum(1 for k in list(self.data) if self._alive(k))
+
+    def flushall(self, *args):
+        self.data.clear()
+        self.expires.clear()
+        return "+OK"
+
+    def memory(self, sub, *args):
+        if sub.upper() == b"USAGE" and args:
+            value = self.get(args[0])
+            return None if value is None else len(args[0]) + len(value) + 50
+        return None
+
+    def info(self, *args):
+        used = sum(len(k) + (len(v) if isinstance(v, bytes) else sum(map(len, v))) for k, v in self.data.items())
+        used += sum(len(x) for v in self.data.values() if isinstance(v, dict) and not isinstance(v, _ZSet)
+                    for x in v.values())
+        return f"# Memory\r\nused_memory:{used}\r\nmaxmemory:0\r\n".encode()
+
+    def client(self, *args):
+        return "+OK"  # CLIENT SETINFO etc. sent by redis-py on connect
+
+    def select(self, db):
+        return "+OK"
+
+    def hello(self, protover=b"2", *args):
+        # redis-py 8 negotiates RESP3; the only encoding differences we need are null and map
+        return {b"server": b"redis", b"version": b"7.2.0", b"proto": int(protover), b"mode": b"standalone"}
+
+    COMMANDS = {
+        b"PING": "ping", b"GET": "get", b"SET": "set", b"SETEX": "setex", b"DEL": "delete",
+        b"UNLINK": "delete", b"EXISTS": "exists", b"EXPIRE": "expire", b"PEXPIRE": "pexpire",
+        b"TTL": "ttl", b"PTTL": "pttl", b"INCR": "incr", b"INCRBY": "incrby", b"SADD": "sadd", b"SMEMBERS": "smembers",
+        b"SCARD": "scard", b"SRANDMEMBER": "srandmember", b"KEYS": "keys", b"DBSIZE": "dbsize",
+        b"FLUSHALL": "flushall", b"FLUSHDB": "flushall", b"MEMORY": "memory", b"INFO": "info",
+        b"CLIENT": "client", b"SELECT": "select", b"HELLO": "hello",
+        b"HSET": "hset", b"HGET": "hget", b"HDEL": "hdel", b"HGETALL": "hgetall", b"HINCRBY": "hincrby",
+        b"ZADD": "zadd", b"ZREM": "zrem", b"ZCARD": "zcard", b"ZRANGE": "zrange", b"ZREMRANGEBYRANK": "zremrangebyrank",
+    }
+
+
+def _encode(value, resp3: bool = False) -> bytes:
+    if value is None:
+        return b"_\r\n" if resp3 else b"$-1\r\n"
+    if isinstance(value, str):
+        # "+OK"-style simple strings, "-ERR ..." errors
+        return value.encode() + b"\r\n"
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, float):
+        return b",%r\r\n" % value if resp3 else _encode(repr(value).encode())
+    if isinstance(value, _ScorePairs):
+        if resp3:
+            return _encode([list(pair) for pair in value], resp3)
+        return _encode([x for member, score in value for x in (member, repr(score).encode())])
+    if isinstance(value, (list, tuple)):
+        return b"*%d\r\n" % len(value) + b"".join(_encode(v, resp3) for v in value)
+    if isinstance(value, dict):
+        items = [x for kv in value.items() for x in kv]
+        if resp3:
+            return b"%%%d\r\n" % len(value) + b"".join(_encode(v, resp3) for v in items)
+        return _encode(items)
+    raise TypeError(type(value))
+
+
+async def _read_command(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.strip().split()  # inline command (e.g. from redis-cli)
+    args = []
+    for _ in range(int(line[1:])):
+        size = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(size + 2))[:-2])
+    return args
+
+
+def make_handler(store: FakeRedis):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        resp3 = False
+        try:
+            while True:
+                args = await _read_command(reader)
+                if args is None:
+                    break
+                if not args:
+                    continue
+                name = FakeRedis.COMMANDS.get(args[0].upper())
+                if name is None:
+                    reply = f"-ERR unknown command '{args[0].decode(errors='replace')}'"
+                else:
+                    if name == "hello":
+                        resp3 = args[1:2] == [b"3"]
+                    try:
+                        reply = getattr(store, name)(*args[1:])
+                    except Exception as e:
+                        reply = f"-ERR {e}"
+                writer.write(_encode(reply, resp3))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def serve(host: str = "127.0.0.1", port: int = 6380, store: FakeRedis = None):
+    server = await asyncio.start_server(make_handler(store or FakeRedis()), host, port)
+    print(f"🧪 Fake Redis on {host}:{port}")
+    return server
+
+
+async def _main(host: str, port: int):
+    server = await serve(host, port)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-memory Redis stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    args = parser.parse_args()
+    asyncio.run(_main(args.host, args.port))
@@ -0,0 +1,327 @@
+"""
+Load generator for the FastAPI server.
+Closed loop: `concurrency` workers issue requests back to back until the
+workload is exhausted. Reports throughput, p50/p95/p99 and, from /metrics,
+the answer cache hit rate over the run.
+
+Workloads:
+- cold        every question is new (all cache misses)
+- warm        questions from a set that was asked once beforehand
+- paraphrase  reworded versions of questions asked beforehand
+- burst       every worker asks the same new question at once (cache stampede)
+- token       GET /voice/token only
+
+Usage (against a running server; see bench/run.py for the full stack):
+    python -m bench.loadgen --url http://127.0.0.1:8000 --workload warm -n 500 -c 32
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import httpx
+
+TOPICS = [
+    "anger", "patience", "forgiveness", "peace", "gratitude", "humility", "prayer", "fasting",
+    "jihad", "tolerance", "dialogue", "women", "family", "marriage", "education", "science",
+    "death", "the afterlife", "paradise", "hell", "god consciousness", "spirituality", "prophethood",
+    "the quran", "hadith", "history", "politics", "violence", "terrorism", "freedom", "wealth",
+    "poverty", "charity", "success", "failure", "hope", "fear", "desire", "ego", "jealousy",
+    "contemplation", "nature", "the universe", "creation", "purpose", "suffering", "trials",
+    "honesty", "justice", "leadership", "unity", "diversity", "interfaith harmony", "revenge",
+    "compassion", "wisdom", "silence", "time management", "discipline", "positive thinking",
+]
+ASPECTS = [
+    "daily life", "the family", "society", "the workplace", "young people", "modern times",
+    "difficult times", "the community", "personal growth", "relationships",
+]
+
+ASK = "What does Maulana Wahiduddin Khan say about {topic}?"
+PARAPHRASES = [
+    "what does maulana wahiduddin khan say about {topic}",
+    "What does the Maulana say about {topic}?",
+    "What is Maulana Wahiduddin Khan's view on {topic}?",
+    "What does Wahiduddin Khan teach about {topic}?",
+    "Tell me what Maulana Wahiduddin Khan says about {topic}.",
+    "what's the Maulana's teaching on {topic}",
+]
+
+WORKLOADS = ("cold", "warm", "paraphrase", "burst", "token")
+# Server replies that mean no answer was given (connection error, upstream guard rejection)
+FAILED_ANSWERS = ("Connection error.", "The library is busy right now. Please try again in a moment.")
+
+
+def cold_questions(n: int, seed: int) -> list:
+    """n distinct questions; a seed offset keeps repeated runs from sharing any"""
+    pairs = [(t, a) for t in TOPICS for a in ASPECTS]
+    random.Random(seed).shuffle(pairs)
+    out = [f"How should we think about {t} in {a}?" for t, a in pairs[:n]]
+    for i in range(len(out), n):
+        t, a = pairs[i % len(pairs)]
+        out.append(f"How should we think about {t} in {a}, part {i // len(pairs)}?")
+    return out
+
+
+def base_questions(k: int) -> list:
+    return [ASK.format(topic=t) for t in TOPICS[:k]]
+
+
+def warm_questions(n: int, k: int, seed: int) -> list:
+    """Skewed (Zipf-like) repeats from the first k topics, as real traffic is"""
+    rng = random.Random(seed)
+    weights = [1 / (i + 1) for i in range(k)]
+    return rng.choices(base_questions(k), weights=weights, k=n)
+
+
+def burst_questions(n: int, concurrency: int, seed: int) -> list:
+    """New questions, each asked `concurrency` times in a row so all workers miss on it together"""
+    questions = cold_questions(-(-n // concurrency), seed + 1000)
+    return [q for q in questions for _ in range(concurrency)][:n]
+
+
+def paraphrased_questions(n: int, k: int, seed: int) -> list:
+    rng = random.Random(seed)
+    return [rng.choice(PARAPHRASES).format(topic=rng.choice(TOPICS[:k])) for _ in range(n)]
+
+
+@dataclass
+class Result:
+    workload: str
+    endpoint: str
+    concurrency: int
+    latencies: list = field(default_factory=list)
+    first_byte: list = field(default_factory=list)
+    errors: int = 0
+    elapsed: float = 0.0
+    cache: dict = field(default_factory=dict)
+    upstream_calls: Optional[int] = None
+
+    @property
+    def throughput(self) -> float:
+        return len(self.latencies) / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        total = sum(self.cache.values())
+        if not total:
+            return None
+        return (self.cache.get("hit", 0) + self.cache.get("stale", 0) + self.cache.get("fallback", 0)) / total
+
+    def summary(self) -> dict:
+        return {
+            "workload": self.workload,
+            "endpoint": self.endpoint,
+            "concurrency": self.concurrency,
+            "requests": len(self.latencies),
+            "errors": self.errors,
+            "throughput_rps": round(self.throughput, 2),
+            "p50_ms": _ms(percentile(self.latencies, 50)),
+            "p95_ms": _ms(percentile(self.latencies, 95)),
+            "p99_ms": _ms(percentile(self.latencies, 99)),
+            "ttfb_p50_ms": _ms(percentile(self.first_byte, 50)),
+            "ttfb_p95_ms": _ms(percentile(self.first_byte, 95)),
+            "hit_rate": None if self.hit_rate is None else round(self.hit_rate, 3),
+            "cache": self.cache,
+            "upstream_calls": self.upstream_calls,
+        }
+
+
+def percentile(values: list, p: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+_CACHE_SAMPLE = re.compile(r'^cps_cache_requests_total\{result="(\w+)"\}\s+([0-9.e+]+)', re.MULTILINE)
+
+
+async def cache_counts(client: httpx.AsyncClient) -> dict:
+    """Current cps_cache_requests_total by result, {} if /metrics is unavailable"""
+    try:
+        resp = await client.get("/metrics")
+    except httpx.HTTPError:
+        return {}
+    counts: dict = {}
+    for result, value in _CACHE_SAMPLE.findall(resp.text):
+        counts[result] = counts.get(result, 0) + float(value)
+    return counts
+
+
+async def upstream_calls(upstream_url: Optional[str]) -> Optional[int]:
+    if not upstream_url:
+        return None
+    try:
+        async with httpx.AsyncClient(base_url=upstream_url) as client:
+            return (await client.get("/stats")).json()["calls"]
+    except (httpx.HTTPError, ValueError, KeyError):
+        return None
+
+
+async def _chat(client: httpx.AsyncClient, question: str, result: Result):
+    start = time.perf_counter()
+    resp = await client.post("/voice/chat", json={"question": question})
+    elapsed = time.perf_counter() - start
+    if resp.status_code != 200 or resp.json().get("answer") in FAILED_ANSWERS:
+        result.errors += 1
+    result.latencies.append(elapsed)
+
+
+async def _chat_stream(client: httpx.AsyncClient, question: str, result: Result):
+    start = time.perf_counter()
+    first = None
+    failed = False
+    async with client.stream("POST", "/voice/chat/stream", json={"question": question}) as resp:
+        failed = resp.status_code != 200
+        async for line in resp.aiter_lines():
+            if first is None and line.startswith("data:"):
+                first = time.perf_counter() - start
+            if any(answer in line for answer in FAILED_ANSWERS):
+                failed = True
+    result.latencies.append(time.perf_counter() - start)
+    if first is not None:
+        result.first_byte.append(first)
+    if failed:
+        result.errors += 1
+
+
+async def _token(client: httpx.AsyncClient, _, result: Result):
+    start = time.perf_counter()
+    resp = await client.get("/voice/token")
+    result.latencies.append(time.perf_counter() - start)
+    if resp.status_code != 200 or "token" not in resp.json():
+        result.errors += 1
+
+
+ENDPOINTS = {"chat": _chat, "stream": _chat_stream, "token": _token}
+
+
+async def drive(client: httpx.AsyncClient, endpoint: str, items: list, concurrency: int, result: Result):
+    """Run `items` through `endpoint` with `concurrency` closed-loop workers"""
+    call = ENDPOINTS[endpoint]
+    queue = iter(items)
+
+    async def worker():
+        for item in queue:
+            try:
+                await call(client, item, result)
+            except (httpx.HTTPError, ValueError):
+                result.errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.elapsed = time.perf_counter() - start
+
+
+async def run_workload(url: str, workload: str, n: int, concurrency: int, *, stream: bool = False,
+                       distinct: int = 40, seed: int = 0, upstream_url: Optional[str] = None,
+                       timeout: float = 120.0) -> Result:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+        endpoint = "token" if workload == "token" else ("stream" if stream else "chat")
+        if workload == "cold":
+            items = cold_questions(n, seed)
+        elif workload == "warm":
+            items = warm_questions(n, distinct, seed)
+        elif workload == "paraphrase":
+            items = paraphrased_questions(n, distinct, seed)
+        elif workload == "burst":
+            items = burst_questions(n, concurrency, seed)
+        else:
+            items = [None] * n
+
+        if workload in ("warm", "paraphrase"):
+            # Prime: ask each base question once (not measured)
+            prime = Result(workload, "chat", concurrency)
+            await drive(client, "chat", base_questions(distinct), concurrency, prime)
+
+        result = Result(workload, endpoint, concurrency)
+        before = await cache_counts(client)
+        calls_before = await upstream_calls(upstream_url)
+        await drive(client, endpoint, items, concurrency, result)
+        after = await cache_counts(client)
+        calls_after = await upstream_calls(upstream_url)
+
+    result.cache = {k: int(after[k] - before.get(k, 0)) for k in after if after[k] - before.get(k, 0)}
+    if calls_before is not None and calls_after is not None:
+        result.upstream_calls = calls_after - calls_before
+    return result
+
+
+def print_report(results: list):
+    cols = ("workload", "endpoint", "concurrency", "requests", "errors", "throughput_rps",
+            "p50_ms", "p95_ms", "p99_ms", "ttfb_p50_ms", "hit_rate", "upstream_calls")
+    rows = [[("-" if r.summary()[c] is None else str(r.summary()[c])) for c in cols] for r in results]
+    widths = [max(len(c), *(len(row[i]) for row in rows)) for i, c in enumerate(cols)]
+    print("  ".join(c.ljust(w) for c, w in zip(cols, widths)))
+    for row in rows:
+        print("  ".join(v.ljust(w) for v, w in zip(row, widths)))
+
+
+def print_comparison(results: list, baseline_file: str):
+    """Relative change against a previous --json report"""
+    with open(baseline_file, encoding="utf-8") as f:
+        baseline = {(r["workload"], r["endpoint"]): r for r in json.load(f)["results"]}
+    print(f"\nvs {baseline_file}:")
+    for r in results:
+        old = baseline.get((r.workload, r.endpoint))
+        if not old:
+            print(f"  {r.workload:<11} (not in baseline for endpoint {r.endpoint})")
+            continue
+        new = r.summary()
+        changes = []
+        for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            if old.get(key) and new.get(key) is not None:
+                changes.append(f"{key} {(new[key] - old[key]) / old[key] * 100:+.1f}%")
+        print(f"  {r.workload:<11} {', '.join(changes)}")
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--workload", choices=WORKLOADS, action="append",
+                        help="repeatable; default: all")
+    parser.add_argument("-n", "--requests", type=int, default=300, help="measured requests per workload")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("--distinct", type=int, default=40, help="distinct questions in warm/paraphrase sets")
+    parser.add_argument("--stream", action="store_true", help="use /voice/chat/stream (reports TTFB)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_out", help="write results to this file")
+    parser.add_argument("--compare", help="previous --json file to compare against")
+
+
+async def run_all(url: str, args, upstream_url: Optional[str] = None) -> list:
+    results = []
+    for i, workload in enumerate(args.workload or WORKLOADS):
+        print(f"⏱️ {workload}: {args.requests} requests, concurrency {args.concurrency}")
+        results.append(await run_workload(
+            url, workload, args.requests, args.concurrency, stream=args.stream,
+            distinct=args.distinct, seed=args.seed + i, upstream_url=upstream_url))
+    print()
+    print_report(results)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k not in ("json_out", "compare")},
+                       "results": [r.summary() for r in results]}, f, indent=2)
+        print(f"\n💾 Results written to {args.json_out}")
+    if args.compare:
+        print_comparison(results, args.compare)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive /voice/chat and /voice/token")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--upstream", help="fake LightRAG URL, to count upstream calls")
+    add_arguments(parser)
+    args = parser.parse_args()
+    asyncio.run(run_all(args.url, args, args.upstream))
@@ -0,0 +1,115 @@
+"""
+Benchmark the server end to end against local stand-ins.
+Starts the in-memory Redis, the fake LightRAG and the FastAPI server as
+subprocesses on spare ports, runs the workloads, prints the report and
+tears everything down. Nothing talks to the real LightRAG or Redis.
+
+Usage (from the repo root):
+    python -m bench.run                                  # all workloads
+    python -m bench.run --latency 2 -c 64 --json before.json
+    python -m bench.run --json after.json --compare before.json
+    python -m bench.run --workload paraphrase --stream
+    python -m bench.run --workload burst --workers 4      # multi-process server
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench import fake_lightrag, loadgen
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port: int, proc: subprocess.Popen, name: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{name} exited with code {proc.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{name} did not start listening on {port}")
+
+
+def start_stack(args, log):
+    """(processes, server URL, fake LightRAG URL)"""
+    redis_port, lightrag_port, server_port = _free_port(), _free_port(), _free_port()
+    metrics_dir = tempfile.mkdtemp(prefix="cps_bench_metrics_")
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        REDIS_HOST="127.0.0.1",
+        REDIS_PORT=str(redis_port),
+        LIGHTRAG_URL=f"http://127.0.0.1:{lightrag_port}",
+        LIVEKIT_API_KEY=os.getenv("LIVEKIT_API_KEY", "bench-key"),
+        LIVEKIT_API_SECRET=os.getenv("LIVEKIT_API_SECRET", "bench-secret-bench-secret-bench-secret"),
+        PROMETHEUS_MULTIPROC_DIR=metrics_dir,
+    )
+    py = sys.executable
+    commands = [
+        ("fake redis", redis_port, [py, "-m", "bench.fake_redis", "--port", str(redis_port)]),
+        ("fake lightrag", lightrag_port, [
+            py, "-m", "bench.fake_lightrag", "--port", str(lightrag_port),
+            "--latency", str(args.latency), "--jitter", str(args.jitter),
+            "--chunk-delay", str(args.chunk_delay), "--error-rate", str(args.error_rate),
+            "--seed", str(args.seed)]),
+        ("server", server_port, [
+            py, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(server_port),
+            "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"]),
+    ]
+    procs = []
+    try:
+        for name, port, cmd in commands:
+            proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+            procs.append(proc)
+            _wait_for_port(port, proc, name)
+    except Exception:
+        stop_stack(procs)
+        raise
+    return procs, f"http://127.0.0.1:{server_port}", f"http://127.0.0.1:{lightrag_port}"
+
+
+def stop_stack(procs):
+    for proc in reversed(procs):
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark against local stand-ins")
+    fake_lightrag.add_arguments(parser)
+    loadgen.add_arguments(parser)
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes")
+    parser.add_argument("--log", default=os.path.join(tempfile.gettempdir(), "cps_bench.log"),
+                        help="where subprocess output goes")
+    args = parser.parse_args()
+
+    print(f"🧪 Fake LightRAG latency {args.latency}s (jitter {args.jitter}), logs in {args.log}")
+    with open(args.log, "w") as log:
+        procs, url, upstream_url = start_stack(args, log)
+        try:
+            asyncio.run(loadgen.run_all(url, args, upstream_url))
+        finally:
+            stop_stack(procs)
+
+
+if __name__ == "__main__":
+    main()
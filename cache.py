@@ -0,0 +1,631 @@
+"""
+CPS Wisdom Bot - Answer Cache
+- Async Redis (never blocks the event loop)
+- Bounded in-process LRU/TTL tier in front of Redis (microsecond hits)
+- Connection backoff: a down Redis is skipped instead of re-pinged per request
+- Stale-while-revalidate: expired answers are served instantly, refreshed in the background
+- One computation per missing key: callers in a process share one in-flight fetch,
+  and a Redis lease per key lets one process across all workers and hosts compute
+  it while the others wait for it (or keep serving the stale one)
+- Compact Redis values: binary header + JSON, zlib-compressed past COMPRESS_MIN bytes
+- Memory budget in LiveKit's Redis: size-aware (GDSF) eviction past CACHE_MAX_MB,
+  and answers nobody asks again expire sooner than popular ones
+"""
+
+import asyncio
+import json
+import os
+import struct
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from metrics import CACHE_BYTES, CACHE_EVICTIONS, CACHE_LEASE, CACHE_LOOKUP, CACHE_REQUESTS
+
+# Optional Redis import - cache works without it (in-process tier only)
+try:
+    import redis.asyncio as aioredis
+    from redis.asyncio.retry import Retry
+    from redis.backoff import NoBackoff
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+    print("⚠️ Redis not installed. Shared caching disabled. Install with: pip install redis")
+
+REDIS_HOST = os.getenv("REDIS_HOST", "127.0.0.1")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6380"))  # LiveKit's Redis
+
+FRESH_TTL = int(os.getenv("CACHE_TTL", "3600"))  # 1 hour
+STALE_TTL = int(os.getenv("CACHE_STALE_TTL", "86400"))  # served stale for up to a day
+L1_MAX_ENTRIES = int(os.getenv("CACHE_L1_MAX_ENTRIES", "2048"))
+
+# Redis shared with LiveKit: the answer cache keeps itself under this many bytes
+CACHE_MAX_BYTES = int(float(os.getenv("CACHE_MAX_MB", "64")) * 1024 * 1024)
+# Evict down to this share of the budget, so a full cache doesn't evict on every write
+EVICT_TO = 0.9
+EVICT_BATCH = 100
+# Redis keeps an entry for fresh_ttl plus a share of stale_ttl that grows with its
+# hits: full stale_ttl from HOT_HITS hits on, just fresh_ttl for answers never asked again
+HOT_HITS = int(os.getenv("CACHE_HOT_HITS", "5"))
+# Hits are counted in-process and written to Redis in one batch this often
+HIT_FLUSH_INTERVAL = 5.0
+
+# Values smaller than this aren't worth compressing
+COMPRESS_MIN = int(os.getenv("CACHE_COMPRESS_MIN", "512"))
+COMPRESS_LEVEL = 6
+
+# Must outlive the longest fetch (LightRAG deadline 60s), so a lease only expires if its holder died
+LEASE_TTL = float(os.getenv("CACHE_LEASE_TTL", "90"))
+# Waiters poll for the holder's value: 25ms, 50ms ... capped
+LEASE_POLL = 0.025
+LEASE_POLL_MAX = 0.25
+# acquire_lease result when Redis is unavailable: every process computes for itself
+NO_LEASE = ""
+# In-flight compute result when another process holds the key's lease
+_LEASED_ELSEWHERE = object()
+
+# Backoff after a failed connect/command: 1s, 2s, 4s ... capped
+BACKOFF_MAX = 60.0
+
+_redis = None
+_redis_lock: Optional[asyncio.Lock] = None
+_retry_at = 0.0
+_failures = 0
+
+
+def mark_redis_down(e: Exception):
+    """Drop the client and skip Redis until the backoff window passes"""
+    global _redis, _retry_at, _failures
+    _failures += 1
+    delay = min(BACKOFF_MAX, 2 ** (_failures - 1))
+    _retry_at = time.monotonic() + delay
+    if _redis is not None:
+        client, _redis = _redis, None
+        asyncio.get_running_loop().create_task(_close_quietly(client))
+    print(f"⚠️ Redis unavailable ({e}). Retrying in {delay:.0f}s.")
+
+
+async def _close_quietly(client):
+    try:
+        await client.aclose()
+    except Exception:
+        pass
+
+
+async def get_redis():
+    """Get the shared async Redis client, or None while Redis is down/backing off"""
+    global _redis, _redis_lock, _failures
+    if not REDIS_AVAILABLE:
+        return None
+    if _redis is not None:
+        return _redis
+    if time.monotonic() < _retry_at:
+        return None
+
+    if _redis_lock is None:
+        _redis_lock = asyncio.Lock()
+    async with _redis_lock:
+        # Another coroutine may have connected (or failed) while we waited
+        if _redis is not None or time.monotonic() < _retry_at:
+            return _redis
+        client = aioredis.Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            db=0,
+            decode_responses=False,  # cache values are binary
+            socket_connect_timeout=0.5,
+            socket_timeout=0.5,
+            # Fail fast; our own backoff decides when to try again
+            retry=Retry(NoBackoff(), 0),
+        )
+        try:
+            await client.ping()
+        except Exception as e:
+            await _close_quietly(client)
+            mark_redis_down(e)
+            return None
+        _redis = client
+        _failures = 0
+        print("✅ Redis connected for caching")
+        return _redis
+
+
+async def close_redis():
+    """Close the shared Redis client (call on app/worker shutdown)"""
+    global _redis
+    if _redis is not None:
+        client, _redis = _redis, None
+        await _close_quietly(client)
+
+
+# Redis value: format byte, stored_at (double), then JSON - zlib-compressed for _ZLIB
+_RAW, _ZLIB = 1, 2
+_HEADER = struct.Struct(">Bd")
+
+
+def encode_entry(entry: "CacheEntry") -> bytes:
+    body = json.dumps(entry.value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    fmt = _RAW
+    if len(body) >= COMPRESS_MIN:
+        packed = zlib.compress(body, COMPRESS_LEVEL)
+        if len(packed) < len(body):
+            body, fmt = packed, _ZLIB
+    return _HEADER.pack(fmt, entry.stored_at) + body
+
+
+def decode_entry(raw: bytes) -> Optional["CacheEntry"]:
+    """Entry from a Redis value (None if unreadable)"""
+    try:
+        if raw[:1] == b"{":
+            # JSON written before the binary format; gone within one stale_ttl
+            data = json.loads(raw)
+            return CacheEntry(data["v"], data["t"])
+        fmt, stored_at = _HEADER.unpack_from(raw)
+        body = raw[_HEADER.size:]
+        if fmt == _ZLIB:
+            body = zlib.decompress(body)
+        elif fmt != _RAW:
+            return None
+        return CacheEntry(json.loads(body), stored_at)
+    except (ValueError, KeyError, TypeError, struct.error, zlib.error):
+        return None
+
+
+class CacheEntry:
+    __slots__ = ("value", "stored_at")
+
+    def __init__(self, value: Any, stored_at: float):
+        self.value = value
+        self.stored_at = stored_at  # wall-clock, comparable across processes
+
+    def age(self) -> float:
+        return time.time() - self.stored_at
+
+
+class AnswerCache:
+    """
+    Two-tier answer cache: in-process LRU in front of Redis.
+    Entries are fresh for `fresh_ttl` seconds, then served stale for up to
+    `stale_ttl` more seconds while get_or_fetch refreshes them in the background.
+    Redis entries under `namespace` are kept within `max_bytes` (bookkeeping in
+    <namespace>:cache:* keys).
+    """
+
+    def __init__(self, fresh_ttl: int = FRESH_TTL, stale_ttl: int = STALE_TTL,
+                 max_entries: int = L1_MAX_ENTRIES, verbose: bool = False,
+                 namespace: str = "cache", max_bytes: int = CACHE_MAX_BYTES):
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.verbose = verbose
+        self.max_bytes = max_bytes
+        self._l1: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._refreshing: dict = {}
+        # key -> task computing it in this process, shared by every caller that misses it;
+        # task -> callers awaiting it (the last one to be cancelled cancels the fetch)
+        self._computing: dict = {}
+        self._joined: dict = {}
+        # Budget bookkeeping: entry sizes and hit counts (hashes), eviction priority
+        # (sorted set), total bytes, and the GDSF clock (priority of the last eviction)
+        meta = f"{namespace}:cache"
+        self._sizes_key = f"{meta}:size"
+        self._hits_key = f"{meta}:hits"
+        self._rank_key = f"{meta}:rank"
+        self._bytes_key = f"{meta}:bytes"
+        self._clock_key = f"{meta}:clock"
+        self._evict_key = f"{meta}:evicting"
+        self._hits: dict = {}  # key -> [hits since last flush, stored_at]
+        self._flush: Optional[asyncio.Task] = None
+        self._evicting: Optional[asyncio.Task] = None
+
+    def _log(self, msg: str):
+        if self.verbose:
+            print(msg)
+
+    # --- L1 (in-process) ---
+
+    def _l1_get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._l1.get(key)
+        if entry is None:
+            return None
+        if entry.age() > self.fresh_ttl + self.stale_ttl:
+            del self._l1[key]
+            return None
+        self._l1.move_to_end(key)
+        return entry
+
+    def _l1_put(self, key: str, entry: CacheEntry):
+        self._l1[key] = entry
+        self._l1.move_to_end(key)
+        while len(self._l1) > self.max_entries:
+            self._l1.popitem(last=False)
+
+    # --- public API ---
+
+    def is_stale(self, entry: CacheEntry) -> bool:
+        return entry.age() > self.fresh_ttl
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        """
+        Look up a key in L1, then Redis. Returns fresh or stale entries.
+        A stale L1 entry is checked against Redis first: another process may have refreshed it.
+        """
+        start = time.perf_counter()
+        entry = self._l1_get(key)
+        if entry is not None and self.is_stale(entry):
+            newer = await self._redis_get(key, newer_than=entry.stored_at)
+            if newer is not None:
+                CACHE_LOOKUP.labels("redis").observe(time.perf_counter() - start)
+                self._count_hit(key, newer)
+                return newer
+        if entry is not None:
+            CACHE_LOOKUP.labels("l1").observe(time.perf_counter() - start)
+            self._count_hit(key, entry)
+            return entry
+
+        entry = await self._redis_get(key)
+        CACHE_LOOKUP.labels("redis" if entry is not None else "miss").observe(time.perf_counter() - start)
+        if entry is not None:
+            self._count_hit(key, entry)
+        return entry
+
+    async def _redis_get(self, key: str, newer_than: float = 0.0) -> Optional[CacheEntry]:
+        """Redis entry for `key` (also put into L1), None if missing or not stored after `newer_than`"""
+        redis_cli = await get_redis()
+        if redis_cli is None:
+            return None
+        try:
+            raw = await redis_cli.get(key)
+        except Exception as e:
+            mark_redis_down(e)
+            return None
+        if not raw:
+            return None
+        entry = decode_entry(raw)
+        if entry is None or entry.stored_at <= newer_than:
+            return None
+        self._l1_put(key, entry)
+        return entry
+
+    async def set(self, key: str, value: Any):
+        """Store a value in both tiers (Redis within the memory budget)"""
+        entry = CacheEntry(value, time.time())
+        self._l1_put(key, entry)
+
+        redis_cli = await get_redis()
+        if redis_cli is None:
+            return
+        blob = encode_entry(entry)
+        try:
+            async with redis_cli.pipeline(transaction=False) as pipe:
+                pipe.hget(self._hits_key, key)
+                pipe.hget(self._sizes_key, key)
+                pipe.get(self._clock_key)
+                hits, old_size, clock = await pipe.execute()
+            hits = int(hits or 0)
+            async with redis_cli.pipeline(transaction=False) as pipe:
+                pipe.set(key, blob, ex=self._retention(entry.stored_at, hits))
+                pipe.hset(self._sizes_key, key, len(blob))
+                pipe.zadd(self._rank_key, {key: self._priority(float(clock or 0), hits, len(blob))})
+                pipe.incrby(self._bytes_key, len(blob) - int(old_size or 0))
+                # Bookkeeping outlives any entry, and goes once the namespace is unused
+                for meta in (self._sizes_key, self._hits_key, self._rank_key, self._bytes_key, self._clock_key):
+                    pipe.expire(meta, self.fresh_ttl + self.stale_ttl)
+                total = (await pipe.execute())[3]
+        except Exception as e:
+            mark_redis_down(e)
+            return
+        CACHE_BYTES.set(total)
+        if total > self.max_bytes and self._evicting is None:
+            self._evicting = asyncio.get_running_loop().create_task(self._evict())
+
+    # --- Redis memory budget ---
+
+    def _retention(self, stored_at: float, hits: int) -> int:
+        """Seconds Redis keeps an entry: fresh_ttl, plus more of stale_ttl the more it is asked"""
+        keep = self.fresh_ttl + self.stale_ttl * min(1.0, hits / max(HOT_HITS, 1))
+        return max(1, int(stored_at + keep - time.time()))
+
+    @staticmethod
+    def _priority(clock: float, hits: int, size: int) -> float:
+        """GreedyDual-Size-Frequency: frequently asked, small answers stay longest"""
+        return clock + (1 + hits) * 1024 / max(size, 1)
+
+    def _count_hit(self, key: str, entry: CacheEntry):
+        """Count a hit; counts go to Redis in batches, off the request path"""
+        pending = self._hits.get(key)
+        if pending is None:
+            self._hits[key] = [1, entry.stored_at]
+        else:
+            pending[0] += 1
+        if self._flush is None:
+            self._flush = asyncio.get_running_loop().create_task(self._flush_hits())
+
+    async def _flush_hits(self):
+        """Raise the priority and retention of the keys hit since the last flush"""
+        try:
+            await asyncio.sleep(HIT_FLUSH_INTERVAL)
+            hits, self._hits = self._hits, {}
+            redis_cli = await get_redis()
+            if redis_cli is None or not hits:
+                return
+            keys = list(hits)
+            async with redis_cli.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.hincrby(self._hits_key, key, hits[key][0])
+                    pipe.hget(self._sizes_key, key)
+                pipe.get(self._clock_key)
+                results = await pipe.execute()
+            clock = float(results[-1] or 0)
+            async with redis_cli.pipeline(transaction=False) as pipe:
+                for i, key in enumerate(keys):
+                    total_hits, size = results[2 * i], results[2 * i + 1]
+                    if size is None:
+                        continue  # evicted meanwhile
+                    pipe.zadd(self._rank_key, {key: self._priority(clock, total_hits, int(size))})
+                    pipe.expire(key, self._retention(hits[key][1], total_hits))
+                await pipe.execute()
+        except Exception as e:
+            mark_redis_down(e)
+        finally:
+            self._flush = None
+
+    async def _evict(self):
+        """
+        Drop the lowest-priority Redis entries until the cache is under EVICT_TO of
+        its budget. Entries that already expired still hold budget until evicted;
+        having no hits, they rank lowest and go first.
+        """
+        try:
+            redis_cli = await get_redis()
+            # One process evicts at a time
+            if redis_cli is None or not await redis_cli.set(self._evict_key, 1, nx=True, ex=30):
+                return
+            try:
+                sizes = await redis_cli.hgetall(self._sizes_key)
+                # The running total drifts with concurrent writers; the sizes are authoritative
+                total = sum(int(size) for size in sizes.values())
+                target = self.max_bytes * EVICT_TO
+                evicted = 0
+                while total > target:
+                    victims = await redis_cli.zrange(self._rank_key, 0, EVICT_BATCH - 1, withscores=True)
+                    if not victims:
+                        break
+                    async with redis_cli.pipeline(transaction=False) as pipe:
+                        for member, priority in victims:
+                            if total <= target:
+                                break
+                            total -= int(sizes.get(member, 0))
+                            pipe.delete(member)
+                            pipe.hdel(self._sizes_key, member)
+                            pipe.hdel(self._hits_key, member)
+                            pipe.zrem(self._rank_key, member)
+                            # GDSF aging: new entries start from the last evicted priority
+                            pipe.set(self._clock_key, priority)
+                            evicted += 1
+                        await pipe.execute()
+                await redis_cli.set(self._bytes_key, total)
+            finally:
+                await redis_cli.delete(self._evict_key)
+            CACHE_BYTES.set(total)
+            if evicted:
+                CACHE_EVICTIONS.inc(evicted)
+                print(f"🧹 Answer cache over {self.max_bytes / 1048576:g}MB: evicted {evicted} entries")
+        except Exception as e:
+            mark_redis_down(e)
+        finally:
+            self._evicting = None
+
+    # --- Redis lease: one process computes each missing key ---
+
+    async def acquire_lease(self, key: str) -> Optional[str]:
+        """
+        Take the lease that lets this process compute `key`. Returns a token for
+        release_lease, NO_LEASE if Redis is unavailable (compute anyway), or None
+        if another process holds it (wait_for its value instead).
+        """
+        redis_cli = await get_redis()
+        if redis_cli is None:
+            return NO_LEASE
+        token = uuid.uuid4().hex
+        try:
+            acquired = await redis_cli.set(f"{key}:lease", token, nx=True, px=int(LEASE_TTL * 1000))
+        except Exception as e:
+            mark_redis_down(e)
+            return NO_LEASE
+        CACHE_LEASE.labels("acquired" if acquired else "busy").inc()
+        return token if acquired else None
+
+    async def release_lease(self, key: str, token: Optional[str]):
+        """Release a lease taken by acquire_lease (no-op for None / NO_LEASE). Store the value first."""
+        if not token:
+            return
+        redis_cli = await get_redis()
+        if redis_cli is None:
+            return
+        # Compare-and-delete: the lease outlives any fetch, so it is still ours
+        # unless it expired, and then this leaves the new holder's lease alone
+        try:
+            if await redis_cli.get(f"{key}:lease") == token.encode():
+                await redis_cli.delete(f"{key}:lease")
+        except Exception as e:
+            mark_redis_down(e)
+
+    async def wait_for(self, key: str, timeout: Optional[float] = None) -> Optional[CacheEntry]:
+        """
+        Wait for the lease holder to store a fresh `key`. Returns None once its
+        lease is gone without a value (it failed), or after `timeout` seconds.
+        """
+        lease = f"{key}:lease"
+        deadline = time.monotonic() + (LEASE_TTL if timeout is None else timeout)
+        delay = LEASE_POLL
+        while time.monotonic() < deadline:
+            await asyncio.sleep(min(delay, deadline - time.monotonic()))
+            redis_cli = await get_redis()
+            if redis_cli is None:
+                break
+            try:
+                held = await redis_cli.exists(lease)
+            except Exception as e:
+                mark_redis_down(e)
+                break
+            # Read after the lease: the holder stores the value before releasing
+            entry = self._l1_get(key)
+            if entry is None or self.is_stale(entry):
+                entry = await self._redis_get(key)
+            if entry is not None and not self.is_stale(entry):
+                CACHE_LEASE.labels("waited").inc()
+                return entry
+            if not held:
+                break
+            delay = min(delay * 2, LEASE_POLL_MAX)
+        CACHE_LEASE.labels("abandoned").inc()
+        return None
+
+    async def _fetch_and_store(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        token = await self.acquire_lease(key)
+        if token is None:
+            return _LEASED_ELSEWHERE
+        try:
+            if token:
+                # Another process may have stored it between our lookup and the lease
+                entry = await self._redis_get(key)
+                if entry is not None and not self.is_stale(entry):
+                    CACHE_LEASE.labels("already_fresh").inc()
+                    return entry.value
+            value = await fetch()
+            await self.set(key, value)
+            return value
+        finally:
+            await self.release_lease(key, token)
+
+    def _computed(self, key: str, task: asyncio.Task):
+        if self._computing.get(key) is task:
+            del self._computing[key]
+        # Mark the exception retrieved even if every caller gave up waiting
+        if not task.cancelled():
+            task.exception()
+
+    def _start_compute(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(self._fetch_and_store(key, fetch))
+        self._computing[key] = task
+        task.add_done_callback(lambda t: self._computed(key, t))
+        return task
+
+    async def _join(self, task: asyncio.Task, deadline: Optional[float]) -> Any:
+        self._joined[task] = self._joined.get(task, 0) + 1
+        try:
+            # shield: one caller giving up must not cancel the fetch others are waiting on
+            if deadline is None:
+                return await asyncio.shield(task)
+            return await asyncio.wait_for(asyncio.shield(task), max(0.0, deadline - time.monotonic()))
+        except asyncio.CancelledError:
+            if self._joined[task] == 1:
+                task.cancel()  # nobody is left waiting for the value
+            raise
+        finally:
+            self._joined[task] -= 1
+            if not self._joined[task]:
+                del self._joined[task]
+
+    def _in_flight(self, key: str) -> Optional[asyncio.Task]:
+        task = self._computing.get(key)
+        # A fetch being cancelled can't be joined: start a new one
+        return None if task is None or task.cancelling() else task
+
+    async def _compute(self, key: str, fetch: Callable[[], Awaitable[Any]], wait: bool = True,
+                       timeout: Optional[float] = None) -> Any:
+        """
+        Fetch and store `key`, sharing the fetch with other callers in this process
+        (it is cancelled only if every caller waiting on it is).
+        The fetch runs under the key's Redis lease; if another process holds it,
+        wait for its value instead (or return None at once unless `wait`). If that
+        holder fails, the waiters race for the lease again: one fetches, the rest
+        keep waiting. Also returns None without `wait` if this process is already
+        computing the key.
+        Raises TimeoutError if no value arrives within `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if self._in_flight(key) is not None and not wait:
+            return None
+        while True:
+            task = self._in_flight(key) or self._start_compute(key, fetch)
+            value = await self._join(task, deadline)
+            if value is not _LEASED_ELSEWHERE:
+                return value
+            if not wait:
+                return None
+            entry = await self.wait_for(key, None if deadline is None else max(0.0, deadline - time.monotonic()))
+            if entry is not None:
+                return entry.value
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"no value for {key} within {timeout:g}s")
+            # The holder failed (its lease is gone without a value): try to take over
+
+    def refresh_in_background(self, key: str, fetch: Callable[[], Awaitable[Any]]):
+        """
+        Re-fetch a stale key without making the caller wait
+        (one refresh per key here, none if another process is already refreshing it)
+        """
+        if key in self._refreshing:
+            return
+
+        async def _refresh():
+            try:
+                if await self._compute(key, fetch, wait=False) is not None:
+                    self._log(f"🔄 Refreshed stale cache entry {key}")
+            except Exception as e:
+                self._log(f"⚠️ Background refresh failed for {key}: {e}")
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.get_running_loop().create_task(_refresh())
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]],
+                           label: Optional[str] = None, fallback_keys=(),
+                           timeout: Optional[float] = None) -> Any:
+        """
+        Return the cached value for `key`, calling `fetch` on a miss (or waiting
+        for the caller or process already computing it, for up to `timeout` seconds).
+        Stale entries are returned immediately and refreshed in the background.
+        On a miss, fresh entries under `fallback_keys` are served before fetching,
+        and stale ones if `fetch` fails.
+        Otherwise exceptions from `fetch` propagate on a miss (nothing is cached),
+        and TimeoutError if waiting for another caller's value outlasts `timeout`.
+        `label` is used in log lines instead of the raw key.
+        """
+        label = label or key
+        entry = await self.get(key)
+        if entry is not None:
+            if self.is_stale(entry):
+                CACHE_REQUESTS.labels("stale").inc()
+                self._log(f"♻️ Cache STALE (refreshing): {label}")
+                self.refresh_in_background(key, fetch)
+            else:
+                CACHE_REQUESTS.labels("hit").inc()
+                self._log(f"✅ Cache HIT: {label}")
+            return entry.value
+
+        stale = None
+        for fallback_key in fallback_keys:
+            entry = await self.get(fallback_key)
+            if entry is None:
+                continue
+            if not self.is_stale(entry):
+                CACHE_REQUESTS.labels("fallback").inc()
+                self._log(f"✅ Cache HIT ({fallback_key}): {label}")
+                return entry.value
+            stale = stale or entry
+
+        CACHE_REQUESTS.labels("miss").inc()
+        self._log(f"🔍 Cache MISS - querying LightRAG: {label}")
+        try:
+            return await self._compute(key, fetch, timeout=timeout)
+        except Exception as e:
+            if stale is None:
+                raise
+            # LightRAG is failing or shedding load: a stale answer beats none
+            self._log(f"♻️ Serving stale fallback ({e}): {label}")
+            return stale.value
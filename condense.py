@@ -0,0 +1,86 @@
+"""
+CPS Wisdom Bot - Tool Result Condensing
+- Splits a retrieved answer into sentences and ranks them against the question (BM25)
+- Keeps the best sentences, in their original order, within a token budget
+Smaller tool output means a faster first LLM token and shorter spoken answers.
+"""
+
+import os
+import re
+
+import numpy as np
+
+from local_index import BM25_B, BM25_K1, split_sentences
+from query_match import TOPICLESS_WORDS, content_terms, normalize_query
+
+# ~4 characters per token for English text
+TOOL_TOKEN_BUDGET = int(os.getenv("TOOL_TOKEN_BUDGET", "120"))
+CHARS_PER_TOKEN = 4
+
+# Small bonus for earlier sentences: LightRAG leads with its summary
+LEAD_BONUS = 0.15
+
+_REFERENCES = re.compile(r'^\W*(references|sources)\W*$', re.IGNORECASE)
+_HEADING = re.compile(r'^\s*#')
+_MARKUP = re.compile(r'\*\*|__|`|^\s*(?:[-*•]|\d+[.)])\s+', re.MULTILINE)
+_CITATION = re.compile(r'\s*\[(?:\d+|KG|DC)[^\]]*\]')
+
+
+def _sentences(text: str) -> list:
+    """Distinct sentences of the answer body: headings, markup, citations and references removed"""
+    sentences = []
+    for line in text.splitlines():
+        if _REFERENCES.match(line.replace("#", "")):
+            break
+        if _HEADING.match(line):
+            continue
+        line = _CITATION.sub("", _MARKUP.sub("", line)).strip()
+        if line:
+            sentences.extend(split_sentences(line))
+    return list(dict.fromkeys(sentences))  # repeated sentences add nothing
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def rank_sentences(sentences: list, question: str) -> np.ndarray:
+    """BM25 score of each sentence for the question, sentences treated as documents"""
+    query = list(dict.fromkeys(t for t in content_terms(normalize_query(question)) if t not in TOPICLESS_WORDS))
+    n = len(sentences)
+    if not query or not n:
+        return np.zeros(n)
+    terms = [content_terms(normalize_query(s)) for s in sentences]
+    lengths = np.array([len(t) for t in terms], dtype=np.float64)
+    tf = np.array([[t.count(q) for q in query] for t in terms], dtype=np.float64)  # sentences x query terms
+    df = (tf > 0).sum(axis=0)
+    idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(lengths.mean(), 1.0))
+    return (tf * (BM25_K1 + 1) / (tf + norm[:, None]) * idf).sum(axis=1)
+
+
+def condense(text: str, question: str, budget: int = TOOL_TOKEN_BUDGET) -> str:
+    """The sentences of `text` most relevant to `question`, within `budget` tokens"""
+    sentences = _sentences(text)
+    if not sentences:
+        return ""
+    scores = rank_sentences(sentences, question)
+    if scores.any():
+        ranked = scores + LEAD_BONUS * scores.max() * (1 - np.arange(len(sentences)) / len(sentences))
+        # Only sentences that share a term with the question
+        order = [i for i in np.argsort(-ranked, kind="stable") if scores[i] > 0]
+    else:
+        order = range(len(sentences))  # nothing matched: keep the lead
+
+    keep, used = [], 0
+    for i in order:
+        cost = _tokens(sentences[i])
+        if used + cost > budget:
+            if keep:
+                continue
+            # Even the best sentence is too long: cut it at a word boundary
+            words = sentences[i][:budget * CHARS_PER_TOKEN].rsplit(" ", 1)[0]
+            return words + "..."
+        keep.append(i)
+        used += cost
+    return " ".join(sentences[i] for i in sorted(keep))
@@ -0,0 +1,120 @@
+"""
+CPS Wisdom Bot - Answer Formatter
+- Markdown-lite to HTML with precompiled patterns
+- Book titles linked in ONE pass via a trie-compiled alternation
+  (cost does not grow linearly with the size of BOOK_MAP)
+- Incremental formatting for streamed answers
+"""
+
+import hashlib
+import json
+import os
+import re
+import urllib.parse
+
+from metrics import FORMAT_LATENCY
+
+BOOK_MAP = {
+    "The Age of Peace": "The-Age-of-Peace.pdf",
+    "The Philosophy of Peace": "The-Philosophy-of-Peace.pdf",
+    "Purpose of Creation": "Purpose-of-Creation.pdf",
+    "Purpose of Life": "Purpose-of-Life.pdf",
+    "Creation Plan of God": "Creation-Plan-of-God.pdf",
+    "Peace in the Quran": "Peace-in-the-Quran.pdf",
+    "The Ideology of Peace": "The-Ideology-of-Peace.pdf",
+    "Islam and Peace": "Islam-and-Peace.pdf",
+}
+
+# Optional larger catalogue: JSON object {"Book Title": "File-Name.pdf", ...}
+BOOK_MAP_FILE = os.getenv("BOOK_MAP_FILE")
+if BOOK_MAP_FILE:
+    with open(BOOK_MAP_FILE, encoding="utf-8") as f:
+        BOOK_MAP.update(json.load(f))
+
+# Changes whenever the catalogue does, so cached HTML from an older catalogue is re-rendered
+FORMAT_VERSION = hashlib.md5(json.dumps(BOOK_MAP, sort_keys=True).encode()).hexdigest()[:8]
+
+_HEADING = re.compile(r'###\s*(.+)')
+_STRONG = re.compile(r'\*\*(.+?)\*\*')
+_LIST_ITEM = re.compile(r'^-\s+(.+)$', re.MULTILINE)
+_PARAGRAPH = re.compile(r'\n\n')
+
+
+def _trie_pattern(words) -> str:
+    """Alternation sharing common prefixes, e.g. purpose of (?:creation|life)"""
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node) -> str:
+        end = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        return f"(?:{body})?" if end else body
+
+    return build(trie)
+
+
+# Lowercased title -> rendered link; one regex finds every title in a single scan
+_BOOK_LINKS = {
+    book.lower(): f'<a href="/pdfs/{urllib.parse.quote(pdf)}" target="_blank">{book} 📥</a>'
+    for book, pdf in BOOK_MAP.items()
+}
+_BOOKS = re.compile(rf'\[?\d*\]?\s*({_trie_pattern(_BOOK_LINKS)})', re.IGNORECASE) if BOOK_MAP else None
+
+
+def _link_book(match) -> str:
+    return _BOOK_LINKS[match.group(1).lower()]
+
+
+def format_body(text: str) -> str:
+    """Format answer text without the outer <p> wrapper"""
+    text = _HEADING.sub(r'<h3>\1</h3>', text)
+    text = _STRONG.sub(r'<strong>\1</strong>', text)
+    text = _LIST_ITEM.sub(r'<li>\1</li>', text)
+    text = _PARAGRAPH.sub('</p><p>', text)
+    if _BOOKS is not None:
+        text = _BOOKS.sub(_link_book, text)
+    return text
+
+
+def format_response(text: str) -> str:
+    with FORMAT_LATENCY.time():
+        return f'<p>{format_body(text)}</p>'
+
+
+class IncrementalFormatter:
+    """
+    Formats a streamed answer chunk by chunk.
+    Complete lines are formatted once and committed; the unfinished last line
+    is re-formatted provisionally on every chunk (it may still grow).
+    """
+
+    def __init__(self):
+        self.pending = ""
+
+    def _safe_cut(self) -> int:
+        # Cut after a newline run that is followed by text, so "\n\n" never splits
+        j = self.pending.rfind("\n")
+        while j != -1 and (j + 1 == len(self.pending) or self.pending[j + 1] == "\n"):
+            j = self.pending.rfind("\n", 0, j)
+        return j + 1
+
+    def feed(self, chunk: str):
+        """Returns (committed HTML delta, provisional HTML for the unfinished line)"""
+        self.pending += chunk
+        cut = self._safe_cut()
+        delta = ""
+        if cut:
+            delta = format_body(self.pending[:cut])
+            self.pending = self.pending[cut:]
+        return delta, format_body(self.pending)
+
+    def flush(self) -> str:
+        delta, self.pending = format_body(self.pending), ""
+        return delta
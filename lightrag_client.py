@@ -0,0 +1,211 @@
+"""
+CPS Wisdom Bot - Shared LightRAG Client
+- One pooled httpx.AsyncClient per process (no TCP setup per question)
+- Singleflight: concurrent identical (query, mode) requests share one upstream call
+- Streaming queries for incremental delivery
+- Every call goes through the upstream guard: bounded queue, deadlines,
+  adaptive timeouts and a circuit breaker (upstream.py)
+"""
+
+import asyncio
+import json
+import os
+import time
+from contextlib import aclosing
+from typing import Optional
+
+import httpx
+
+from metrics import LIGHTRAG_COALESCED, LIGHTRAG_FIRST_CHUNK, LIGHTRAG_INFLIGHT, LIGHTRAG_LATENCY
+from upstream import Rejected, UpstreamGuard
+
+LIGHTRAG_URL = os.getenv("LIGHTRAG_URL", "http://127.0.0.1:9621")
+
+# Connection pool sized for bursty traffic against a single local upstream
+POOL_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("LIGHTRAG_MAX_CONNECTIONS", "50")),
+    max_keepalive_connections=int(os.getenv("LIGHTRAG_MAX_KEEPALIVE", "20")),
+    keepalive_expiry=60.0,
+)
+
+_client: Optional[httpx.AsyncClient] = None
+
+# (query, mode) -> task shared by every caller waiting on that upstream call
+_inflight: dict = {}
+# task -> callers awaiting it; the last one to be cancelled cancels the call
+_waiters: dict = {}
+
+# Concurrency limit, timeouts and circuit breaker shared by all calls in this process
+guard = UpstreamGuard()
+
+
+class LightRAGError(Exception):
+    """LightRAG could not produce an answer (bad status or connection failure)"""
+
+
+class LightRAGRejected(LightRAGError):
+    """LightRAG was not asked: too many calls queued, deadline spent queueing, or circuit open"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"LightRAG call rejected: {reason}")
+        self.reason = reason
+
+
+def get_client() -> httpx.AsyncClient:
+    """Get or create the process-wide pooled LightRAG client"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(base_url=LIGHTRAG_URL, limits=POOL_LIMITS, timeout=60.0)
+    return _client
+
+
+async def close_client():
+    """Close the pooled client (call on app/worker shutdown)"""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+async def _post_query(query: str, mode: str, timeout: float) -> dict:
+    try:
+        async with guard.slot(timeout) as remaining:
+            return await _request(query, mode, guard.timeout(mode, remaining))
+    except Rejected as e:
+        raise LightRAGRejected(e.reason) from e
+
+
+async def _request(query: str, mode: str, timeout: float) -> dict:
+    start = time.perf_counter()
+    outcome = "error"
+    LIGHTRAG_INFLIGHT.inc()
+    try:
+        try:
+            # httpx timeouts apply per read; the deadline covers the whole call
+            resp = await asyncio.wait_for(
+                get_client().post("/query", json={"query": query, "mode": mode}, timeout=timeout), timeout)
+        except (httpx.TimeoutException, asyncio.TimeoutError) as e:
+            outcome = "timeout"
+            guard.observe(mode, timeout)
+            raise LightRAGError(f"LightRAG request timed out after {timeout:.1f}s: {e!r}") from e
+        except httpx.HTTPError as e:
+            raise LightRAGError(f"LightRAG request failed: {e!r}") from e
+        if resp.status_code != 200:
+            raise LightRAGError(f"LightRAG returned HTTP {resp.status_code}")
+        try:
+            result = resp.json()
+        except ValueError as e:
+            raise LightRAGError("LightRAG returned invalid JSON") from e
+        outcome = "ok"
+        guard.observe(mode, time.perf_counter() - start)
+        return result
+    finally:
+        LIGHTRAG_INFLIGHT.dec()
+        LIGHTRAG_LATENCY.labels(mode, outcome).observe(time.perf_counter() - start)
+
+
+def _forget(key, task: asyncio.Task):
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    # Mark the exception retrieved even if every waiter was cancelled
+    if not task.cancelled():
+        task.exception()
+
+
+async def query_lightrag(query: str, mode: str = "naive", timeout: float = 60.0) -> dict:
+    """
+    Query LightRAG through the pooled client.
+    Concurrent calls with the same (query, mode) are coalesced into one request;
+    every caller receives the same result (or the same LightRAGError). The request
+    is cancelled only when every caller waiting on it has been cancelled.
+    `timeout` is the deadline for the whole call, queueing included; raises
+    LightRAGRejected without calling LightRAG if the guard turns it away.
+    """
+    key = (query, mode)
+    task = _inflight.get(key)
+    if task is None or task.cancelling():
+        task = asyncio.create_task(_post_query(query, mode, timeout))
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _forget(key, t))
+    else:
+        LIGHTRAG_COALESCED.inc()
+    _waiters[task] = _waiters.get(task, 0) + 1
+    try:
+        # shield: one caller going away must not cancel the call others are waiting on
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        if _waiters[task] == 1:
+            task.cancel()  # nobody is left waiting for the answer
+        raise
+    finally:
+        _waiters[task] -= 1
+        if not _waiters[task]:
+            del _waiters[task]
+
+
+async def stream_lightrag(query: str, mode: str = "mix", timeout: float = 60.0):
+    """
+    Stream a LightRAG answer as it is generated (POST /query/stream, NDJSON lines).
+    Yields text chunks; raises LightRAGError on failure (LightRAGRejected if the
+    guard turns the call away). The stream holds a guard slot until it ends, is closed,
+    or runs past its deadline.
+    """
+    try:
+        async with guard.slot(timeout) as remaining:
+            async with aclosing(_stream(query, mode, guard.timeout(mode, remaining))) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+    except Rejected as e:
+        raise LightRAGRejected(e.reason) from e
+
+
+async def _stream(query: str, mode: str, timeout: float):
+    payload = {"query": query, "mode": mode, "stream": True}
+    start = time.perf_counter()
+    # httpx timeouts apply per read; the deadline covers the whole stream,
+    # so a slowly trickling answer can't hold its guard slot forever
+    deadline = time.monotonic() + timeout
+    first = True
+    outcome = "error"
+    LIGHTRAG_INFLIGHT.inc()
+    try:
+        client = get_client()
+        request = client.build_request("POST", "/query/stream", json=payload, timeout=timeout)
+        resp = await asyncio.wait_for(client.send(request, stream=True), timeout)
+        try:
+            if resp.status_code != 200:
+                raise LightRAGError(f"LightRAG returned HTTP {resp.status_code}")
+            async with aclosing(resp.aiter_lines()) as lines:
+                while True:
+                    try:
+                        line = await asyncio.wait_for(anext(lines), deadline - time.monotonic())
+                    except StopAsyncIteration:
+                        break
+                    if not line.strip():
+                        continue
+                    try:
+                        data = json.loads(line)
+                    except ValueError:
+                        continue
+                    if data.get("error"):
+                        raise LightRAGError(f"LightRAG stream error: {data['error']}")
+                    # Other lines (e.g. references) carry no answer text
+                    chunk = data.get("response")
+                    if chunk:
+                        if first:
+                            first = False
+                            LIGHTRAG_FIRST_CHUNK.labels(mode).observe(time.perf_counter() - start)
+                        yield chunk
+        finally:
+            await resp.aclose()
+        outcome = "ok"
+        guard.observe(mode, time.perf_counter() - start)
+    except (httpx.TimeoutException, asyncio.TimeoutError) as e:
+        outcome = "timeout"
+        guard.observe(mode, timeout)
+        raise LightRAGError(f"LightRAG stream timed out after {timeout:.1f}s: {e!r}") from e
+    except httpx.HTTPError as e:
+        raise LightRAGError(f"LightRAG stream failed: {e!r}") from e
+    finally:
+        LIGHTRAG_INFLIGHT.dec()
+        LIGHTRAG_LATENCY.labels(mode, outcome).observe(time.perf_counter() - start)
@@ -0,0 +1,270 @@
+"""
+CPS Wisdom Bot - Local Book Index
+- BM25 over paragraph chunks of the PDFs listed in BOOK_MAP
+- Built once into LOCAL_INDEX_DIR and memory-mapped, so every process shares the pages
+- Rebuilt automatically when a PDF (or the catalogue) changes
+- Supplies fallback passages when LightRAG is slow or down (answers.get_answer_hedged)
+
+Usage:
+    python local_index.py build
+    python local_index.py search "what is the purpose of life"
+"""
+
+import hashlib
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Optional
+
+import numpy as np
+
+from formatter import BOOK_MAP
+from query_match import content_terms, normalize_query
+
+# Optional pypdf import - only needed to build the index, not to search it
+try:
+    from pypdf import PdfReader
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+    print("⚠️ pypdf not installed. Local book index can't be built. Install with: pip install pypdf")
+
+PDF_DIR = os.getenv("PDF_DIR", "pdfs")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "local_index")
+CHUNK_WORDS = int(os.getenv("LOCAL_INDEX_CHUNK_WORDS", "120"))
+LOCAL_PASSAGES = int(os.getenv("LOCAL_PASSAGES", "3"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+INDEX_VERSION = 1
+
+_BLANK_LINE = re.compile(r'\n\s*\n')
+_HYPHEN_BREAK = re.compile(r'(\w)-\n(\w)')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+(?=["“(\[]?[A-Z0-9])')
+# Index directories are named by fingerprint()
+_INDEX_NAME = re.compile(r'^[0-9a-f]{12}$')
+
+
+def _pdf_path(pdf: str) -> str:
+    return os.path.join(PDF_DIR, pdf)
+
+
+def fingerprint() -> str:
+    """Identifies the current corpus: catalogue plus size/mtime of every PDF"""
+    sources = []
+    for book, pdf in sorted(BOOK_MAP.items()):
+        try:
+            st = os.stat(_pdf_path(pdf))
+            sources.append([book, pdf, st.st_size, int(st.st_mtime)])
+        except OSError:
+            sources.append([book, pdf, None, None])
+    raw = json.dumps([INDEX_VERSION, CHUNK_WORDS, sources])
+    return hashlib.md5(raw.encode()).hexdigest()[:12]
+
+
+def split_sentences(text: str) -> list:
+    return [s.strip() for s in _SENTENCE_END.split(text) if s.strip()]
+
+
+def _chunks(text: str) -> list:
+    """Paragraph chunks of roughly CHUNK_WORDS words"""
+    text = _HYPHEN_BREAK.sub(r'\1\2', text)
+    chunks, carry = [], ""
+    for para in _BLANK_LINE.split(text):
+        para = " ".join(para.split())
+        if not para:
+            continue
+        if carry:
+            para, carry = f"{carry} {para}", ""
+        words = len(para.split())
+        if words < CHUNK_WORDS // 4:
+            carry = para  # heading or fragment: attach to the next paragraph
+            continue
+        if words <= CHUNK_WORDS * 2:
+            chunks.append(para)
+            continue
+        # Long (or unbroken) text: cut at sentence boundaries
+        piece = []
+        for sentence in split_sentences(para):
+            piece.append(sentence)
+            if sum(len(s.split()) for s in piece) >= CHUNK_WORDS:
+                chunks.append(" ".join(piece))
+                piece = []
+        if piece:
+            chunks.append(" ".join(piece))
+    if carry:
+        chunks.append(carry)
+    return chunks
+
+
+def build_index(out_dir: Optional[str] = None) -> Optional[str]:
+    """Extract, chunk and index every available PDF. Returns the index directory."""
+    if not PDF_AVAILABLE:
+        return None
+    start = time.perf_counter()
+    out_dir = out_dir or os.path.join(LOCAL_INDEX_DIR, fingerprint())
+    books, chunk_text, chunk_book = [], [], []
+    for book, pdf in BOOK_MAP.items():
+        path = _pdf_path(pdf)
+        if not os.path.exists(path):
+            print(f"⚠️ Local index: {path} not found, skipping {book}")
+            continue
+        try:
+            pages = PdfReader(path).pages
+            text = "\n\n".join(page.extract_text() or "" for page in pages)
+        except Exception as e:
+            print(f"⚠️ Local index: could not read {path}: {e}")
+            continue
+        for chunk in _chunks(text):
+            chunk_text.append(chunk)
+            chunk_book.append(len(books))
+        books.append(book)
+    if not chunk_text:
+        print("⚠️ Local index: no text extracted, nothing to index")
+        return None
+
+    postings = defaultdict(list)
+    doc_len = np.zeros(len(chunk_text), dtype=np.int32)
+    for i, chunk in enumerate(chunk_text):
+        tf = Counter(content_terms(normalize_query(chunk)))
+        doc_len[i] = sum(tf.values())
+        for term, count in tf.items():
+            postings[term].append((i, count))
+
+    terms, docs, freqs = {}, [], []
+    for term in sorted(postings):
+        entries = postings[term]
+        terms[term] = [len(docs), len(docs) + len(entries)]
+        docs.extend(d for d, _ in entries)
+        freqs.extend(min(n, 65535) for _, n in entries)
+
+    encoded = [c.encode("utf-8") for c in chunk_text]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+
+    # Write next to the target and rename into place, so readers never see a partial index
+    tmp_dir = f"{out_dir}.tmp-{os.getpid()}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    with open(os.path.join(tmp_dir, "text.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    np.save(os.path.join(tmp_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(tmp_dir, "doc_book.npy"), np.array(chunk_book, dtype=np.int16))
+    np.save(os.path.join(tmp_dir, "doc_len.npy"), doc_len)
+    np.save(os.path.join(tmp_dir, "post_doc.npy"), np.array(docs, dtype=np.int32))
+    np.save(os.path.join(tmp_dir, "post_tf.npy"), np.array(freqs, dtype=np.uint16))
+    with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": INDEX_VERSION, "books": books, "avgdl": float(doc_len.mean()),
+                   "terms": terms}, f)
+    try:
+        os.rename(tmp_dir, out_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)  # another process built it first
+
+    # Indexes of older corpora are no longer read; anything else in the directory isn't ours
+    parent = os.path.dirname(out_dir) or "."
+    for name in os.listdir(parent):
+        old = os.path.join(parent, name)
+        if (old != out_dir and _INDEX_NAME.match(name)
+                and os.path.isfile(os.path.join(old, "manifest.json"))):
+            shutil.rmtree(old, ignore_errors=True)
+
+    print(f"📚 Local index built: {len(chunk_text)} passages from {len(books)} books, "
+          f"{len(terms)} terms in {time.perf_counter() - start:.1f}s")
+    return out_dir
+
+
+class LocalIndex:
+    """Read-only BM25 index; postings and passage text stay memory-mapped"""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.books = manifest["books"]
+        self.avgdl = manifest["avgdl"] or 1.0
+        self.terms = manifest["terms"]
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.doc_book = np.load(os.path.join(path, "doc_book.npy"), mmap_mode="r")
+        self.doc_len = np.load(os.path.join(path, "doc_len.npy"), mmap_mode="r")
+        self.post_doc = np.load(os.path.join(path, "post_doc.npy"), mmap_mode="r")
+        self.post_tf = np.load(os.path.join(path, "post_tf.npy"), mmap_mode="r")
+        with open(os.path.join(path, "text.bin"), "rb") as f:
+            self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.path = path
+        self.size = len(self.doc_len)
+
+    def __len__(self):
+        return self.size
+
+    def passage(self, doc: int) -> str:
+        return self._text[int(self.offsets[doc]):int(self.offsets[doc + 1])].decode("utf-8")
+
+    def search(self, query: str, k: int = LOCAL_PASSAGES) -> list:
+        """Top-k (score, book, passage) by BM25"""
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(content_terms(normalize_query(query))):
+            span = self.terms.get(term)
+            if span is None:
+                continue
+            start, end = span
+            docs = self.post_doc[start:end]
+            tf = self.post_tf[start:end].astype(np.float32)
+            df = end - start
+            idf = math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[docs] / self.avgdl)
+            scores[docs] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        k = min(k, self.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[d]), self.books[self.doc_book[d]], self.passage(d)) for d in top if scores[d] > 0]
+
+
+_index: Optional[LocalIndex] = None
+
+
+def load_local_index(build: bool = False) -> Optional[LocalIndex]:
+    """Map the index for the current corpus (building it first if allowed and missing)"""
+    global _index
+    path = os.path.join(LOCAL_INDEX_DIR, fingerprint())
+    if _index is not None and _index.path == path:
+        return _index
+    if not os.path.exists(os.path.join(path, "manifest.json")):
+        if not build or build_index(path) is None:
+            return None
+    try:
+        index = LocalIndex(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Local index unreadable ({e}), rebuild with: python local_index.py build")
+        return None
+    _index = index
+    print(f"📚 Local index loaded: {len(index)} passages")
+    return _index
+
+
+def local_answer(query: str, k: int = LOCAL_PASSAGES) -> Optional[str]:
+    """Best matching book passages as answer text, or None if nothing matches (or no index is loaded)"""
+    if _index is None:
+        return None
+    hits = _index.search(query, k)
+    if not hits:
+        return None
+    parts = [f"**{book}**: {text}" for _, book, text in hits]
+    return "Here are the most relevant passages from the books:\n\n" + "\n\n".join(parts)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "build":
+        sys.exit(0 if build_index() else 1)
+    if len(sys.argv) >= 3 and sys.argv[1] == "search":
+        if load_local_index() is None:
+            sys.exit("No index for the current corpus. Run: python local_index.py build")
+        for score, book, text in _index.search(" ".join(sys.argv[2:])):
+            print(f"{score:6.2f}  {book}: {text[:200]}...")
+        sys.exit(0)
+    sys.exit(__doc__)
@@ -0,0 +1,160 @@
+"""
+CPS Wisdom Bot - Metrics
+Prometheus histograms, counters and gauges for the hot path of both entry points.
+- Server: GET /metrics
+- Agent: the worker's own metrics server on AGENT_METRICS_PORT, aggregated
+  across job processes via PROMETHEUS_MULTIPROC_DIR
+Cache hit ratio: rate(cps_cache_requests_total{result="hit"}) / rate(cps_cache_requests_total)
+"""
+
+import os
+import tempfile
+
+# Optional prometheus_client import - everything below becomes a no-op without it
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+        generate_latest, multiprocess,
+    )
+    METRICS_AVAILABLE = True
+except ImportError:
+    METRICS_AVAILABLE = False
+    print("⚠️ prometheus_client not installed. Metrics disabled. Install with: pip install prometheus-client")
+
+AGENT_METRICS_PORT = int(os.getenv("AGENT_METRICS_PORT", "9101"))
+AGENT_METRICS_DIR = os.getenv("AGENT_METRICS_DIR", "/tmp/cps_agent_metrics")
+
+# Microseconds (in-process hits) up to Redis round trips
+CACHE_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+# LightRAG answers take seconds
+UPSTREAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60)
+FORMAT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+VOICE_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10)
+STARTUP_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20)
+
+
+class _Noop:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, *args, **kwargs):
+        pass
+
+    def inc(self, *args, **kwargs):
+        pass
+
+    def dec(self, *args, **kwargs):
+        pass
+
+    def set(self, *args, **kwargs):
+        pass
+
+    def time(self):
+        return self
+
+    def track_inprogress(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+if METRICS_AVAILABLE:
+    CACHE_LOOKUP = Histogram(
+        "cps_cache_lookup_seconds", "Answer cache lookup latency", ["result"], buckets=CACHE_BUCKETS)
+    CACHE_REQUESTS = Counter(
+        "cps_cache_requests", "Answer cache outcomes (hit, stale, fallback, miss)", ["result"])
+    CACHE_BYTES = Gauge(
+        "cps_cache_redis_bytes", "Answer cache size in Redis (last seen by this process)",
+        multiprocess_mode="mostrecent")
+    CACHE_EVICTIONS = Counter(
+        "cps_cache_evictions", "Answers evicted from Redis to stay within CACHE_MAX_MB")
+    CACHE_LEASE = Counter(
+        "cps_cache_lease", "Per-key Redis leases on a miss (acquired, busy, waited, abandoned, already_fresh)", ["outcome"])
+    LIGHTRAG_LATENCY = Histogram(
+        "cps_lightrag_request_seconds", "LightRAG round trip", ["mode", "outcome"], buckets=UPSTREAM_BUCKETS)
+    LIGHTRAG_FIRST_CHUNK = Histogram(
+        "cps_lightrag_first_chunk_seconds", "Time to first streamed LightRAG chunk", ["mode"],
+        buckets=UPSTREAM_BUCKETS)
+    LIGHTRAG_INFLIGHT = Gauge(
+        "cps_lightrag_inflight", "LightRAG requests in flight", multiprocess_mode="livesum")
+    LIGHTRAG_COALESCED = Counter(
+        "cps_lightrag_coalesced", "Callers that joined an identical in-flight LightRAG request")
+    LIGHTRAG_QUEUED = Gauge(
+        "cps_lightrag_queued", "LightRAG calls waiting for a free slot", multiprocess_mode="livesum")
+    LIGHTRAG_REJECTED = Counter(
+        "cps_lightrag_rejected", "LightRAG calls not made (queue_full, deadline, circuit_open)", ["reason"])
+    LIGHTRAG_CIRCUIT = Gauge(
+        "cps_lightrag_circuit_state", "LightRAG circuit breaker (0 closed, 1 half-open, 2 open)",
+        multiprocess_mode="livemax")
+    FORMAT_LATENCY = Histogram(
+        "cps_format_seconds", "format_response latency", buckets=FORMAT_BUCKETS)
+    REQUESTS_INFLIGHT = Gauge(
+        "cps_requests_inflight", "Requests being handled", ["endpoint"], multiprocess_mode="livesum")
+    VOICE_STAGE = Histogram(
+        "cps_voice_stage_seconds",
+        "Voice pipeline stage latency (end_of_turn, stt_final, llm_first_token, tool_call, tts_first_byte)",
+        ["stage"], buckets=VOICE_BUCKETS)
+    LOCAL_FALLBACK = Counter(
+        "cps_local_fallback", "Answers served from the local book index (budget, error, rejected)", ["reason"])
+    AGENT_STARTUP = Histogram(
+        "cps_agent_startup_seconds",
+        "Agent startup: worker process prewarm, and job start until the session is live",
+        ["phase"], buckets=STARTUP_BUCKETS)
+else:
+    CACHE_LOOKUP = CACHE_REQUESTS = LIGHTRAG_LATENCY = LIGHTRAG_FIRST_CHUNK = _Noop()
+    LIGHTRAG_INFLIGHT = LIGHTRAG_COALESCED = FORMAT_LATENCY = REQUESTS_INFLIGHT = VOICE_STAGE = _Noop()
+    CACHE_BYTES = CACHE_EVICTIONS = CACHE_LEASE = LOCAL_FALLBACK = AGENT_STARTUP = LIGHTRAG_QUEUED = LIGHTRAG_REJECTED = LIGHTRAG_CIRCUIT = _Noop()
+
+
+def render_metrics():
+    """(body, content type) for a /metrics response, aggregating worker processes if configured"""
+    if not METRICS_AVAILABLE:
+        return b"", "text/plain"
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def use_multiprocess_dir(prefix: str) -> str:
+    """
+    Point worker processes at an empty PROMETHEUS_MULTIPROC_DIR (a fresh temp dir
+    unless one is configured). Call in the parent, before the workers start.
+    """
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR") or tempfile.mkdtemp(prefix=prefix)
+    os.makedirs(path, exist_ok=True)
+    # Files left by a previous run would be added to this run's totals
+    for name in os.listdir(path):
+        if name.endswith(".db"):
+            os.remove(os.path.join(path, name))
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    return path
+
+
+def mark_process_exit():
+    """Drop this process's live gauges from the aggregated metrics (call on worker shutdown)"""
+    if METRICS_AVAILABLE and os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
+
+
+# ChatMessage.metrics keys -> voice stage label
+_USER_STAGES = {"end_of_turn_delay": "end_of_turn", "transcription_delay": "stt_final"}
+_ASSISTANT_STAGES = {"llm_node_ttft": "llm_first_token", "tts_node_ttfb": "tts_first_byte"}
+
+
+def observe_voice_turn(item):
+    """AgentSession "conversation_item_added" handler: record per-turn stage latencies"""
+    report = getattr(item, "metrics", None)
+    if not report:
+        return
+    stages = _USER_STAGES if getattr(item, "role", None) == "user" else _ASSISTANT_STAGES
+    for key, stage in stages.items():
+        value = report.get(key)
+        if value is not None and value >= 0:
+            VOICE_STAGE.labels(stage).observe(value)
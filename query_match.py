@@ -0,0 +1,185 @@
+"""
+CPS Wisdom Bot - Query Normalization & Near-Duplicate Matching
+- Normalizes case, punctuation, contractions and stopwords
+- MinHash/LSH index over content-word sets finds paraphrases of earlier questions
+- Paraphrases above QUERY_MATCH_THRESHOLD (Jaccard) share one cache key
+"""
+
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from typing import Optional
+
+MATCH_THRESHOLD = float(os.getenv("QUERY_MATCH_THRESHOLD", "0.8"))
+INDEX_MAX_ENTRIES = int(os.getenv("QUERY_INDEX_MAX_ENTRIES", "10000"))
+
+# 16 bands x 4 rows: pairs with Jaccard >= ~0.5 almost always share a bucket;
+# the exact Jaccard check against MATCH_THRESHOLD decides the final match
+NUM_BANDS = 16
+ROWS_PER_BAND = 4
+NUM_PERM = NUM_BANDS * ROWS_PER_BAND
+
+_MERSENNE = (1 << 61) - 1
+_PERMS = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE | 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE)
+    for i in range(NUM_PERM)
+]
+
+# "'s" expands only after these words; elsewhere it is possessive and dropped
+_IS_WORDS = {"what", "who", "where", "when", "why", "how", "it", "that", "there", "here", "he", "she"}
+_CONTRACTIONS = [
+    (re.compile(r"\bcan't\b"), "can not"),
+    (re.compile(r"\bwon't\b"), "will not"),
+    (re.compile(r"n't\b"), " not"),
+    (re.compile(r"'re\b"), " are"),
+    (re.compile(r"'ve\b"), " have"),
+    (re.compile(r"'ll\b"), " will"),
+    (re.compile(r"'m\b"), " am"),
+    (re.compile(r"'d\b"), " would"),
+]
+_APOSTROPHE_S = re.compile(r"\b(\w+)'s\b")
+_NON_WORD = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+# Negations and question words (except the filler "what"/"which") are deliberately
+# NOT stopwords: "how"/"why"/"not" change what is being asked
+STOPWORDS = frozenset("""
+what which a an the is are was were be been being am do does did of to in on at by for
+with about as into from this that these those it its i me my we our you your
+he him his she her they them their please tell explain describe can could
+would should will shall may might must there here some any just so and or
+""".split())
+
+# Content words that say nothing about the topic: the author's name (which the LLM
+# adds to tool questions), "what does he say/teach about", and small talk
+TOPICLESS_WORDS = frozenset({
+    "maulana", "wahiduddin", "khan",
+    "say", "teach", "teaching", "view", "opinion", "think", "know",
+    "hi", "hello", "hey", "salam", "thank", "thanks", "okay", "ok", "yes",
+})
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, expand contractions, strip punctuation and collapse whitespace"""
+    q = query.lower().replace("’", "'").replace("‘", "'")
+    for pattern, repl in _CONTRACTIONS:
+        q = pattern.sub(repl, q)
+    q = _APOSTROPHE_S.sub(lambda m: f"{m.group(1)} is" if m.group(1) in _IS_WORDS else m.group(1), q)
+    q = _NON_WORD.sub(" ", q)
+    return _SPACES.sub(" ", q).strip()
+
+
+def _stem(token: str) -> str:
+    # Plural folding only: "teachings" -> "teaching", keeps "peace"/"less"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def content_terms(normalized: str) -> list:
+    """Content words in order, repeats kept (stopwords removed, plurals folded)"""
+    return [_stem(t) for t in normalized.split() if t not in STOPWORDS]
+
+
+def content_tokens(normalized: str) -> frozenset:
+    """Content-word set used for similarity"""
+    return frozenset(content_terms(normalized))
+
+
+def _minhash(tokens: frozenset) -> list:
+    hashes = [int.from_bytes(hashlib.blake2b(t.encode(), digest_size=8).digest(), "big") for t in tokens]
+    return [min((a * h + b) % _MERSENNE for h in hashes) for a, b in _PERMS]
+
+
+def _bands(signature: list) -> list:
+    return [
+        (i, tuple(signature[i * ROWS_PER_BAND:(i + 1) * ROWS_PER_BAND]))
+        for i in range(NUM_BANDS)
+    ]
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class QueryIndex:
+    """
+    Bounded LSH index of previously seen questions.
+    canonicalize() maps a question onto the normalized text of an earlier
+    near-duplicate (so they share a cache key), or registers it as new.
+    """
+
+    def __init__(self, threshold: float = MATCH_THRESHOLD, max_entries: int = INDEX_MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        # normalized text -> (content tokens, band keys), oldest first
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._buckets: dict = {}
+        # normalized paraphrase -> canonical, so repeats skip MinHash
+        self._aliases: "OrderedDict[str, str]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def find(self, normalized: str, tokens: frozenset) -> Optional[str]:
+        """Best indexed near-duplicate of `normalized`, or None"""
+        if normalized in self._entries:
+            return normalized
+        if not tokens:
+            return None
+        best, best_score = None, self.threshold
+        candidates = set()
+        for band in _bands(_minhash(tokens)):
+            candidates.update(self._buckets.get(band, ()))
+        for candidate in candidates:
+            score = jaccard(tokens, self._entries[candidate][0])
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best
+
+    def add(self, normalized: str, tokens: frozenset):
+        if normalized in self._entries:
+            self._entries.move_to_end(normalized)
+            return
+        bands = _bands(_minhash(tokens)) if tokens else []
+        self._entries[normalized] = (tokens, bands)
+        for band in bands:
+            self._buckets.setdefault(band, set()).add(normalized)
+        while len(self._entries) > self.max_entries:
+            self._evict()
+
+    def _evict(self):
+        old, (_, bands) = self._entries.popitem(last=False)
+        for band in bands:
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(old)
+                if not bucket:
+                    del self._buckets[band]
+
+    def canonicalize(self, query: str) -> str:
+        """Normalized text of the earliest matching question (registering new ones)"""
+        normalized = normalize_query(query)
+        if normalized in self._entries:
+            self._entries.move_to_end(normalized)
+            return normalized
+        alias = self._aliases.get(normalized)
+        if alias is not None and alias in self._entries:
+            self._entries.move_to_end(alias)
+            return alias
+
+        # The author's name and "say/teach/view" would dominate short questions
+        tokens = content_tokens(normalized) - TOPICLESS_WORDS
+        match = self.find(normalized, tokens)
+        if match is None:
+            self.add(normalized, tokens)
+            return normalized
+        self._entries.move_to_end(match)
+        self._aliases[normalized] = match
+        while len(self._aliases) > self.max_entries:
+            self._aliases.popitem(last=False)
+        return match
@@ -0,0 +1,57 @@
+"""
+CPS Wisdom Bot - Voice Rooms & Agent Dispatch
+- Every voice session gets its own room, so each caller gets their own agent job
+- The token dispatches the agent explicitly by name (no automatic dispatch into every room)
+- Workers report load as the busier of CPU and job slots, so LiveKit spreads
+  new sessions across worker processes and hosts
+"""
+
+import os
+import uuid
+
+from livekit import api
+
+# Must match between the token endpoint and the agent worker
+AGENT_NAME = os.getenv("AGENT_NAME", "cps-wisdom")
+ROOM_PREFIX = os.getenv("VOICE_ROOM_PREFIX", "voice-")
+# Close a session's room this long after it empties / the caller leaves
+ROOM_EMPTY_TIMEOUT = int(os.getenv("VOICE_ROOM_EMPTY_TIMEOUT", "60"))
+ROOM_DEPARTURE_TIMEOUT = int(os.getenv("VOICE_ROOM_DEPARTURE_TIMEOUT", "10"))
+
+# Concurrent conversations one worker host should carry at full load
+AGENT_MAX_JOBS = int(os.getenv("AGENT_MAX_JOBS", "8"))
+# Stop taking new sessions above this load (0-1)
+AGENT_LOAD_THRESHOLD = float(os.getenv("AGENT_LOAD_THRESHOLD", "0.75"))
+
+
+def new_room_name() -> str:
+    return f"{ROOM_PREFIX}{uuid.uuid4().hex[:12]}"
+
+
+def voice_token(api_key: str, api_secret: str, identity: str, room: str) -> str:
+    """Join token for `room` that also dispatches our agent into it"""
+    return (
+        api.AccessToken(api_key, api_secret)
+        .with_identity(identity)
+        .with_grants(api.VideoGrants(room_join=True, room=room))
+        .with_room_config(api.RoomConfiguration(
+            empty_timeout=ROOM_EMPTY_TIMEOUT,
+            departure_timeout=ROOM_DEPARTURE_TIMEOUT,
+            agents=[api.RoomAgentDispatch(agent_name=AGENT_NAME)],
+        ))
+        .to_jwt()
+    )
+
+
+_cpu = None
+
+
+def worker_load(worker) -> float:
+    """WorkerOptions.load_fnc: the busier of CPU and the share of job slots in use"""
+    global _cpu
+    if _cpu is None:
+        from livekit.agents.utils.hw import get_cpu_monitor
+        _cpu = get_cpu_monitor()
+    jobs = len(worker.active_jobs) / max(AGENT_MAX_JOBS, 1)
+    # Runs in an executor thread, so sampling CPU for a moment doesn't block the worker
+    return min(1.0, max(jobs, _cpu.cpu_percent(0.25)))
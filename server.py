@@ -1,87 +1,65 @@
 """
 CPS Wisdom Bot - FastAPI Server
 FIXED: Chat alignment issue - properly identifies user vs bot messages
-OPTIMIZED: Redis caching for text chat endpoint
+OPTIMIZED: Two-tier caching (in-process + async Redis) for text chat endpoint
+OPTIMIZED: Streaming text chat (SSE) with incremental formatting
+PROTECTED: LightRAG calls are queued, time-boxed and circuit-broken (upstream.py)
+SCALING: SERVER_WORKERS processes; a Redis lease per cache key keeps misses to one LightRAG call
+BATCH: POST /voice/chat/batch answers many questions with bounded LightRAG fan-out
+OPTIMIZED: /voice/ precompressed with ETags; /pdfs/{name} with Range and caching headers
+MONITORING: Prometheus metrics at /metrics
 """
 
+import asyncio
 import os
+import time
 import uuid
-import re
-import urllib.parse
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
-from livekit import api
+from collections import Counter
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
-import httpx
 import json
-import hashlib
+from contextlib import asynccontextmanager
 from typing import Optional
 
-# Optional Redis import - server works without it (just no caching)
-try:
-    import redis
-    REDIS_AVAILABLE = True
-except ImportError:
-    REDIS_AVAILABLE = False
-    print("⚠️ Redis not installed. Caching disabled. Install with: pip install redis")
-
+# Load .env before local modules read their configuration
 load_dotenv()
-app = FastAPI()
-API_KEY = os.getenv("LIVEKIT_API_KEY")
-API_SECRET = os.getenv("LIVEKIT_API_SECRET")
 
-# Redis connection for caching
-redis_client = None
+from lightrag_client import stream_lightrag, close_client, LightRAGError, LightRAGRejected
+from cache import close_redis
+from formatter import IncrementalFormatter
+from metrics import (
+    CACHE_REQUESTS, LOCAL_FALLBACK, REQUESTS_INFLIGHT, mark_process_exit, render_metrics, use_multiprocess_dir,
+)
+from answers import (
+    TEXT_HEDGE_AFTER, TEXT_MODE, answer_cache, cache_key, cache_value, fetch_answer, get_answer,
+    get_answer_hedged, local_value, query_index, remember_question, rendered, seed_query_index,
+)
+from local_index import load_local_index
+from rooms import new_room_name, voice_token
+from static import PrecompressedPage, pdf_response
 
-def get_redis_client():
-    """Get or create Redis client for caching"""
-    global redis_client
-    if not REDIS_AVAILABLE:
-        return None
-    
-    if redis_client is None:
-        try:
-            redis_client = redis.Redis(
-                host='127.0.0.1',
-                port=6380,
-                db=0,
-                decode_responses=True,
-                socket_connect_timeout=2
-            )
-            redis_client.ping()
-        except Exception:
-            redis_client = None
-    return redis_client
-
-def get_cache_key(query: str) -> str:
-    """Generate cache key from query"""
-    return f"lightrag:chat:{hashlib.md5(query.lower().strip().encode()).hexdigest()}"
-
-BOOK_MAP = {
-    "The Age of Peace": "The-Age-of-Peace.pdf",
-    "The Philosophy of Peace": "The-Philosophy-of-Peace.pdf",
-    "Purpose of Creation": "Purpose-of-Creation.pdf",
-    "Purpose of Life": "Purpose-of-Life.pdf",
-    "Creation Plan of God": "Creation-Plan-of-God.pdf",
-    "Peace in the Quran": "Peace-in-the-Quran.pdf",
-    "The Ideology of Peace": "The-Ideology-of-Peace.pdf",
-    "Islam and Peace": "Islam-and-Peace.pdf",
-}
+# uvicorn worker processes for `python server.py`; each is a full copy of the app
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "1"))
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
 
-def format_response(text):
-    text = re.sub(r'###\s*(.+)', r'<h3>\1</h3>', text)
-    text = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', text)
-    text = re.sub(r'^-\s+(.+)$', r'<li>\1</li>', text, flags=re.MULTILINE)
-    text = re.sub(r'\n\n', '</p><p>', text)
-    for book, pdf in BOOK_MAP.items():
-        encoded = urllib.parse.quote(pdf)
-        link = f'<a href="/pdfs/{encoded}" target="_blank">{book} 📥</a>'
-        text = re.sub(rf'\[?\d*\]?\s*{re.escape(book)}', link, text, flags=re.IGNORECASE)
-    return f'<p>{text}</p>'
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await seed_query_index()
+    # Map the local book index (building it on first start) without delaying startup
+    index_task = asyncio.create_task(asyncio.to_thread(load_local_index, True))
+    yield
+    index_task.cancel()
+    await close_client()
+    await close_redis()
+    mark_process_exit()
 
-@app.get("/voice/")
-async def get_page():
-    return HTMLResponse("""
+app = FastAPI(lifespan=lifespan)
+API_KEY = os.getenv("LIVEKIT_API_KEY")
+API_SECRET = os.getenv("LIVEKIT_API_SECRET")
+
+PAGE_HTML = """
 <!DOCTYPE html>
 <html>
 <head>
@@ -254,63 +232,345 @@ function endVoice() { if (room) room.disconnect(); room = null; ub = null; bb =
 async function sendText() {
     var i = document.getElementById('inp'), q = i.value.trim();
     if (!q) return; if (room) endVoice(); show(); i.value = ''; addMsg(q, 'user'); loading(true);
-    try { var r = await fetch('/voice/chat', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ question: q }) }); var d = await r.json(); loading(false); addMsg(d.answer || 'No response.', 'bot'); } catch (e) { loading(false); addMsg('Error.', 'bot'); }
+    var el = null, html = '';
+    try {
+        // Streamed answer (SSE): "delta" is committed HTML, "tail" the still-growing last line,
+        // "html" a complete pre-rendered answer (cache hit)
+        var r = await fetch('/voice/chat/stream', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ question: q }) });
+        if (!r.ok || !r.body) throw new Error('HTTP ' + r.status);
+        var reader = r.body.getReader(), dec = new TextDecoder(), buf = '';
+        while (true) {
+            var c = await reader.read(); if (c.done) break;
+            buf += dec.decode(c.value, { stream: true });
+            var evs = buf.split('\\n\\n'); buf = evs.pop();
+            evs.forEach(function(ev) {
+                var data = ev.split('\\n').filter(function(l) { return l.indexOf('data:') === 0; }).map(function(l) { return l.slice(5); }).join('\\n');
+                if (!data) return;
+                var d = JSON.parse(data);
+                if (d.delta === undefined && d.tail === undefined && d.html === undefined) return;
+                if (!el) { loading(false); el = addMsg('', 'bot'); }
+                if (d.html !== undefined) { el.innerHTML = d.html; }
+                else { html += d.delta || ''; el.innerHTML = '<p>' + html + (d.tail || '') + '</p>'; }
+                var cDiv = document.getElementById('chat'); cDiv.scrollTop = cDiv.scrollHeight;
+            });
+        }
+        if (!el) { loading(false); addMsg('No response.', 'bot'); }
+    } catch (e) { loading(false); if (!el) addMsg('Error.', 'bot'); }
 }
 </script>
 </body>
 </html>
-""")
+"""
+
+# OPTIMIZED: encoded once at startup (gzip/brotli + ETag), not rebuilt per request
+page = PrecompressedPage(PAGE_HTML)
+
+@app.get("/voice/")
+async def get_page(request: Request):
+    return page.response(request)
+
+@app.api_route("/pdfs/{name}", methods=["GET", "HEAD"])
+async def get_pdf(request: Request, name: str):
+    """Book PDFs linked from answers: BOOK_MAP files only, with Range and caching headers"""
+    return pdf_response(request, name)
+
+GREETINGS = {"hi", "hello", "salam", "hey"}
+GREETING_REPLY = "Peace be upon you. How can I help?"
+# LightRAG is overloaded or down (upstream guard rejected the call) and nothing cached or local matched
+BUSY_REPLY = "The library is busy right now. Please try again in a moment."
+
+# Batch endpoint: questions per request, and LightRAG calls in flight per batch
+# (the upstream guard still caps the total across all requests)
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # stop nginx from buffering the stream
+}
 
 @app.post("/voice/chat")
 async def chat_endpoint(data: dict):
-    """Text chat endpoint with Redis caching"""
+    """Text chat endpoint with two-tier caching"""
     q = data.get("question", "").strip()
     if not q:
         return {"answer": ""}
     
     # Handle greetings
-    if q.lower() in ["hi", "hello", "salam", "hey"]:
-        return {"answer": "Peace be upon you. How can I help?"}
+    if q.lower() in GREETINGS:
+        return {"answer": GREETING_REPLY}
     
-    # Check cache first
-    cache_key = get_cache_key(q)
-    redis_cli = get_redis_client()
-    
-    if redis_cli:
+    # Cached answer if available (stale entries refresh in the background)
+    try:
+        with REQUESTS_INFLIGHT.labels("chat").track_inprogress():
+            result = await get_answer_hedged(q, TEXT_MODE, timeout=60)
+    except LightRAGRejected:
+        return {"answer": BUSY_REPLY}
+    except LightRAGError:
+        return {"answer": "Connection error."}
+
+    return {"answer": rendered(result)}
+
+def _sse(payload: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload)}\n\n"
+
+async def _stream_answer(q: str):
+    with REQUESTS_INFLIGHT.labels("chat_stream").track_inprogress():
+        async for event in _stream_events(q):
+            yield event
+
+async def _stream_events(q: str):
+    if q.lower() in GREETINGS:
+        yield _sse({"delta": GREETING_REPLY})
+        yield _sse({}, event="done")
+        return
+
+    canonical = query_index.canonicalize(q)
+    key = cache_key(canonical, TEXT_MODE)
+    entry = await answer_cache.get(key)
+    if entry is not None:
+        if answer_cache.is_stale(entry):
+            CACHE_REQUESTS.labels("stale").inc()
+            answer_cache.refresh_in_background(key, lambda: fetch_answer(q, TEXT_MODE, 60, canonical))
+        else:
+            CACHE_REQUESTS.labels("hit").inc()
+        yield _sse({"html": rendered(entry.value)})
+        yield _sse({}, event="done")
+        return
+
+    CACHE_REQUESTS.labels("miss").inc()
+    token = await answer_cache.acquire_lease(key)
+    if token is None:
+        # Another worker is already asking LightRAG: wait for its answer,
+        # or serve local passages once the budget is spent
+        local = local_value(q)
+        deadline = time.monotonic() + (TEXT_HEDGE_AFTER if local is not None else 60)
+        entry = None
+        while entry is None and time.monotonic() < deadline:
+            entry = await answer_cache.wait_for(key, deadline - time.monotonic())
+            if entry is None:
+                # The holder failed: one waiter takes the lease over, the rest wait again
+                token = await answer_cache.acquire_lease(key)
+                if token is not None:
+                    break
+        if token is None:
+            if entry is None and local is None:
+                yield _sse({"delta": BUSY_REPLY})
+            elif entry is None:
+                LOCAL_FALLBACK.labels("budget").inc()
+                yield _sse({"html": rendered(local)})
+            else:
+                yield _sse({"html": rendered(entry.value)})
+            yield _sse({}, event="done")
+            return
+    async for event in _stream_miss(q, key, canonical, token):
+        yield event
+
+# LightRAG streams still being read after their client got local passages (they fill the cache)
+_background: set = set()
+
+async def _finish_stream(key: str, canonical: str, token: Optional[str], first: asyncio.Future, chunks):
+    """Read the rest of a hedged stream and cache the answer, then release the key's lease"""
+    parts = []
+    try:
         try:
-            cached = redis_cli.get(cache_key)
-            if cached:
-                result = json.loads(cached)
-                return {"answer": format_response(result.get("response", ""))}
-        except Exception:
+            chunk = await first
+            while True:
+                parts.append(chunk)
+                chunk = await anext(chunks)
+        except StopAsyncIteration:
             pass
-    
-    # Query LightRAG
-    async with httpx.AsyncClient(timeout=60) as client:
+        finally:
+            await chunks.aclose()
+        raw = "".join(parts)
+        if raw:
+            await answer_cache.set(key, cache_value(raw))
+            await remember_question(canonical)
+    except LightRAGError as e:
+        print(f"⚠️ Background LightRAG stream failed for {key}: {e}")
+    finally:
+        await answer_cache.release_lease(key, token)
+
+async def _stream_miss(q: str, key: str, canonical: str, token: Optional[str]):
+    """
+    Stream the answer from LightRAG and cache it. Takes over the key's lease
+    from the caller and releases it once the answer is stored.
+    """
+    chunks = stream_lightrag(q, mode=TEXT_MODE, timeout=60)
+    first = asyncio.ensure_future(anext(chunks))
+    handed_off = False
+    try:
+        done, _ = await asyncio.wait({first}, timeout=TEXT_HEDGE_AFTER)
+        local = None if done else local_value(q)
+        if local is not None:
+            # LightRAG missed the budget: serve local passages while the same stream
+            # runs on in the background and fills the cache (it keeps the lease)
+            task = asyncio.create_task(_finish_stream(key, canonical, token, first, chunks))
+            _background.add(task)
+            task.add_done_callback(_background.discard)
+            handed_off = True
+            LOCAL_FALLBACK.labels("budget").inc()
+            yield _sse({"html": rendered(local)})
+            yield _sse({}, event="done")
+            return
+
+        formatter = IncrementalFormatter()
+        parts = []
         try:
-            resp = await client.post("http://127.0.0.1:9621/query", json={"query": q, "mode": "mix"})
-            if resp.status_code == 200:
-                raw = resp.json().get("response", "No answer.")
-                
-                # Cache the result
-                if redis_cli:
-                    try:
-                        redis_cli.setex(cache_key, 3600, json.dumps({"response": raw}))
-                    except Exception:
-                        pass
-                
-                return {"answer": format_response(raw)}
-        except Exception:
+            chunk = await first
+            while True:
+                parts.append(chunk)
+                delta, tail = formatter.feed(chunk)
+                yield _sse({"delta": delta, "tail": tail})
+                chunk = await anext(chunks)
+        except StopAsyncIteration:
             pass
-    
-    return {"answer": "Connection error."}
+        except LightRAGError as e:
+            rejected = isinstance(e, LightRAGRejected)
+            # Keep whatever already arrived, but never cache a truncated answer
+            if parts:
+                yield _sse({"delta": formatter.flush()})
+            elif (local := local_value(q)) is not None:
+                LOCAL_FALLBACK.labels("rejected" if rejected else "error").inc()
+                yield _sse({"html": rendered(local)})
+            else:
+                yield _sse({"delta": BUSY_REPLY if rejected else "Connection error."})
+            yield _sse({}, event="done")
+            return
+
+        raw = "".join(parts)
+        yield _sse({"delta": formatter.flush() if raw else "No answer."})
+        if raw:
+            await answer_cache.set(key, cache_value(raw))
+            await remember_question(canonical)
+        yield _sse({}, event="done")
+    finally:
+        if not handed_off:
+            first.cancel()
+            await asyncio.wait({first})
+            await chunks.aclose()
+            await answer_cache.release_lease(key, token)
+
+@app.post("/voice/chat/stream")
+async def chat_stream_endpoint(data: dict):
+    """Text chat streamed as Server-Sent Events while LightRAG generates"""
+    q = data.get("question", "").strip()
+    if not q:
+        return StreamingResponse(iter([_sse({}, event="done")]), media_type="text/event-stream")
+    return StreamingResponse(_stream_answer(q), media_type="text/event-stream", headers=SSE_HEADERS)
+
+async def _batch_results(questions: list, concurrency: int):
+    """
+    Yield {"index", "question", "answer", "source"} for every question as its answer
+    completes, then a {"done": true, ...} summary. Repeated and paraphrased questions
+    share one lookup; cache hits come back at once, misses go to LightRAG at most
+    `concurrency` at a time (and stay cached, so a batch also warms the cache).
+    """
+    start = time.perf_counter()
+    groups = {}  # canonical question (None for empty ones) -> indexes asking it
+    for i, q in enumerate(questions):
+        groups.setdefault(query_index.canonicalize(q) if q else None, []).append(i)
+    sem = asyncio.Semaphore(concurrency)
+
+    async def answer(canonical: Optional[str], indexes: list):
+        q = questions[indexes[0]]
+        if canonical is None:
+            return indexes, "", "empty"
+        if q.lower() in GREETINGS:
+            return indexes, GREETING_REPLY, "greeting"
+        key = cache_key(canonical, TEXT_MODE)
+        entry = await answer_cache.get(key)
+        if entry is not None:
+            if answer_cache.is_stale(entry):
+                CACHE_REQUESTS.labels("stale").inc()
+                answer_cache.refresh_in_background(key, lambda: fetch_answer(q, TEXT_MODE, 60, canonical))
+            else:
+                CACHE_REQUESTS.labels("hit").inc()
+            return indexes, rendered(entry.value), "cache"
+        try:
+            async with sem:
+                value = await get_answer(q, TEXT_MODE, timeout=60)
+        except LightRAGRejected:
+            return indexes, BUSY_REPLY, "rejected"
+        except LightRAGError:
+            return indexes, "Connection error.", "error"
+        return indexes, rendered(value), "lightrag"
+
+    tasks = [asyncio.ensure_future(answer(canonical, indexes)) for canonical, indexes in groups.items()]
+    sources = Counter()
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            indexes, text, source = await next_done
+            sources[source] += len(indexes)
+            for i in indexes:
+                yield {"index": i, "question": questions[i], "answer": text, "source": source}
+    finally:
+        # Client went away: stop asking LightRAG for the rest
+        for task in tasks:
+            task.cancel()
+    yield {"done": True, "questions": len(questions), "unique": len(groups), **sources,
+           "seconds": round(time.perf_counter() - start, 2)}
+
+async def _batch_lines(questions: list, concurrency: int):
+    with REQUESTS_INFLIGHT.labels("chat_batch").track_inprogress():
+        async for result in _batch_results(questions, concurrency):
+            yield json.dumps(result) + "\n"
+
+@app.post("/voice/chat/batch")
+async def chat_batch_endpoint(data: dict):
+    """
+    Answer many questions in one request (FAQ evaluation runs, cache warming).
+    Body: {"questions": [...], "stream": true, "concurrency": BATCH_CONCURRENCY}
+    Streams NDJSON, one line per question in completion order and a final summary;
+    with "stream": false returns {"answers": [...] in question order, "summary": {...}}.
+    """
+    questions = data.get("questions")
+    if not isinstance(questions, list) or not all(isinstance(q, str) for q in questions):
+        return JSONResponse({"error": "questions must be a list of strings"}, status_code=400)
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return JSONResponse({"error": f"at most {BATCH_MAX_QUESTIONS} questions per batch"}, status_code=413)
+    questions = [q.strip() for q in questions]
+    concurrency = data.get("concurrency")
+    if not isinstance(concurrency, int) or not 0 < concurrency <= BATCH_CONCURRENCY:
+        concurrency = BATCH_CONCURRENCY
+
+    if data.get("stream", True):
+        return StreamingResponse(_batch_lines(questions, concurrency),
+                                 media_type="application/x-ndjson", headers=SSE_HEADERS)
+    answers = [None] * len(questions)
+    with REQUESTS_INFLIGHT.labels("chat_batch").track_inprogress():
+        async for result in _batch_results(questions, concurrency):
+            if "index" in result:
+                answers[result.pop("index")] = result
+            else:
+                summary = result
+    return {"answers": answers, "summary": summary}
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics (cache, LightRAG, formatting, in-flight requests)"""
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
 
 @app.get("/voice/token")
 async def get_token():
-    """Generate LiveKit access token with user_ prefix for easy identification"""
-    t = api.AccessToken(API_KEY, API_SECRET).with_identity("user_" + uuid.uuid4().hex[:6]).with_grants(api.VideoGrants(room_join=True, room="voice-room"))
-    return {"token": t.to_jwt()}
+    """
+    Generate LiveKit access token with user_ prefix for easy identification
+    SCALING: each call gets its own room, and the token dispatches an agent into it
+    """
+    room = new_room_name()
+    token = voice_token(API_KEY, API_SECRET, "user_" + uuid.uuid4().hex[:6], room)
+    return {"token": token, "room": room}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if SERVER_WORKERS > 1:
+        # SCALING: one process per core. Workers share answers (and leases) through
+        # Redis and metrics through PROMETHEUS_MULTIPROC_DIR; the book index is
+        # built once here instead of by every worker
+        use_multiprocess_dir("cps_server_metrics_")
+        load_local_index(build=True)
+        uvicorn.run("server:app", host=SERVER_HOST, port=SERVER_PORT, workers=SERVER_WORKERS)
+    else:
+        uvicorn.run(app, host=SERVER_HOST, port=SERVER_PORT)
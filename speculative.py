@@ -0,0 +1,152 @@
+"""
+CPS Wisdom Bot - Speculative Retrieval
+Starts the LightRAG lookup from stable interim STT transcripts, before
+end-of-speech, the final transcript and the LLM's tool call, then hands the
+prefetched result to search_knowledge when the tool question matches.
+"""
+
+import asyncio
+import os
+from typing import Awaitable, Callable, Optional
+
+from query_match import TOPICLESS_WORDS, content_tokens, normalize_query
+
+SPECULATIVE_SEARCH = os.getenv("SPECULATIVE_SEARCH", "1") == "1"
+# An interim transcript is "stable" if it repeats, or no newer one arrives within this window
+SPECULATE_AFTER = float(os.getenv("SPECULATE_AFTER_MS", "600")) / 1000
+SPECULATE_MIN_WORDS = int(os.getenv("SPECULATE_MIN_WORDS", "1"))
+# Share of the question's content words the prefetched query must cover for a match
+SPECULATE_MATCH = float(os.getenv("SPECULATE_MATCH", "0.6"))
+
+
+def _tokens(text: str) -> frozenset:
+    return content_tokens(normalize_query(text)) - TOPICLESS_WORDS
+
+
+def _coverage(prefetched: frozenset, wanted: frozenset) -> float:
+    """Share of the wanted content words the prefetched query also has"""
+    if not prefetched or not wanted:
+        return 0.0
+    return len(prefetched & wanted) / len(wanted)
+
+
+class SpeculativeSearch:
+    """
+    Per-session speculative search. Feed it every transcript via on_transcript();
+    search_knowledge calls take(question) to reuse a matching prefetch.
+    """
+
+    def __init__(self, search: Callable[[str], Awaitable[dict]],
+                 delay: float = SPECULATE_AFTER, min_words: int = SPECULATE_MIN_WORDS,
+                 match_threshold: float = SPECULATE_MATCH, enabled: bool = SPECULATIVE_SEARCH):
+        self._search = search
+        self.delay = delay
+        self.min_words = min_words
+        self.match_threshold = match_threshold
+        self.enabled = enabled
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._interim = ""
+        self._interim_tokens = frozenset()
+        self._turn_done = False
+        self.query: Optional[str] = None
+        self.tokens = frozenset()
+        self.task: Optional[asyncio.Task] = None
+        # Prefetches that outlasted take()'s timeout: still running, for the caller's own lookup to join
+        self._detached: set = set()
+
+    def on_transcript(self, transcript: str, is_final: bool):
+        """AgentSession "user_input_transcribed" handler"""
+        text = transcript.strip()
+        if not self.enabled or not text:
+            return
+        if self._turn_done:
+            # First transcript of a new turn: the last turn's prefetch went unused
+            self._turn_done = False
+            self._interim, self._interim_tokens = "", frozenset()
+            self.cancel()
+
+        if is_final:
+            self._turn_done = True
+            self._cancel_timer()
+            # Still ahead of the LLM deciding to call the tool: restart unless the
+            # prefetch already covers everything the final transcript asks
+            self._start(text, _tokens(text))
+            return
+
+        tokens = _tokens(text)
+        if tokens and tokens == self._interim_tokens:
+            self._cancel_timer()
+            self._start(text, tokens)
+        else:
+            self._interim, self._interim_tokens = text, tokens
+            self._cancel_timer()
+            self._timer = asyncio.get_running_loop().call_later(self.delay, self._on_stable)
+
+    def _on_stable(self):
+        self._timer = None
+        self._start(self._interim, self._interim_tokens)
+
+    def _start(self, text: str, tokens: frozenset):
+        if len(tokens) < self.min_words:
+            return
+        if self.task is not None:
+            if self._covers(tokens):
+                return  # already searching for (a superset of) this
+            print(f"🗑️ Speculative search replaced: {self.query[:50]}...")
+            self.cancel()
+        self.query, self.tokens = text, tokens
+        self.task = asyncio.get_running_loop().create_task(self._search(text))
+        print(f"⚡ Speculative search: {text[:50]}...")
+
+    def _covers(self, tokens: frozenset) -> bool:
+        """The running prefetch asks at least as much as `tokens` (a narrower one doesn't)"""
+        return _coverage(self.tokens, tokens) >= self.match_threshold and len(tokens) <= len(self.tokens)
+
+    async def take(self, question: str, timeout: Optional[float] = None) -> Optional[dict]:
+        """
+        Prefetched result if the speculative query matches `question`, else None.
+        Also None if the prefetch isn't done within `timeout` seconds (it keeps running,
+        so the caller's own lookup can join its LightRAG call) or only found local passages.
+        """
+        task, tokens, query = self.task, self.tokens, self.query
+        self.task, self.query, self.tokens = None, None, frozenset()
+        if task is None:
+            return None
+        if _coverage(tokens, _tokens(question)) < self.match_threshold:
+            task.cancel()
+            return None
+        # wait() never cancels the prefetch if our caller is cancelled
+        done, _ = await asyncio.wait({task}, timeout=timeout)
+        if not done:
+            self._detached.add(task)
+            task.add_done_callback(self._forget)
+            return None
+        if task.cancelled() or task.exception() is not None:
+            return None
+        result = task.result()
+        if result.get("source") == "local":
+            return None  # a stand-in for a slow answer, not the answer
+        print(f"⚡ Using speculative result for: {query[:50]}...")
+        return result
+
+    def _forget(self, task: asyncio.Task):
+        self._detached.discard(task)
+        if not task.cancelled():
+            task.exception()  # retrieved: the caller's own lookup reports failures
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def cancel(self):
+        """Drop any pending or in-flight speculation"""
+        self._cancel_timer()
+        if self.task is not None:
+            self.task.cancel()
+        self.task, self.query, self.tokens = None, None, frozenset()
+
+    async def aclose(self):
+        self.cancel()
+        for task in list(self._detached):
+            task.cancel()
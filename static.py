@@ -0,0 +1,121 @@
+"""
+CPS Wisdom Bot - Static Delivery
+- The /voice/ page is encoded once at startup (identity, gzip, brotli) and served
+  from memory with strong ETags: repeat visits get a bodiless 304
+- /pdfs/{name} serves only the PDFs listed in BOOK_MAP, with Range, ETag and
+  Cache-Control; file I/O stays off the event loop (or off the app entirely
+  behind nginx with PDF_ACCEL_PREFIX)
+"""
+
+import gzip
+import hashlib
+import os
+import urllib.parse
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+
+from formatter import BOOK_MAP
+from local_index import PDF_DIR
+
+# Optional brotli import - gzip is always available
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+    print("⚠️ brotli not installed. Pages served gzip only. Install with: pip install brotli")
+
+# The page may change with any deploy: browsers revalidate (cheap 304) instead of guessing
+PAGE_CACHE_CONTROL = "no-cache"
+# Books change rarely; a changed file gets a new ETag
+PDF_CACHE_CONTROL = f"public, max-age={int(os.getenv('PDF_MAX_AGE', '86400'))}"
+# Behind nginx: hand PDF delivery to nginx (sendfile) via X-Accel-Redirect to this internal location
+PDF_ACCEL_PREFIX = os.getenv("PDF_ACCEL_PREFIX", "")
+
+# Preferred first when the client accepts several
+_ENCODINGS = ("br", "gzip")
+
+
+def _accepted(header: str) -> set:
+    """Content codings an Accept-Encoding header allows (q > 0)"""
+    accepted = set()
+    for part in header.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip())
+    return accepted
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for it)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == bare for tag in if_none_match.split(","))
+
+
+class PrecompressedPage:
+    """A fixed body, compressed once, served by content negotiation"""
+
+    def __init__(self, body: str, media_type: str = "text/html; charset=utf-8"):
+        raw = body.encode("utf-8")
+        tag = hashlib.sha256(raw).hexdigest()[:16]
+        self.media_type = media_type
+        # Each encoding is a different representation, so each gets its own strong ETag
+        self.variants = {
+            "identity": (raw, f'"{tag}"'),
+            "gzip": (gzip.compress(raw, 9, mtime=0), f'"{tag}-gzip"'),
+        }
+        if BROTLI_AVAILABLE:
+            self.variants["br"] = (brotli.compress(raw, quality=11), f'"{tag}-br"')
+
+    def response(self, request: Request) -> Response:
+        accepted = _accepted(request.headers.get("accept-encoding", ""))
+        encoding = next((e for e in _ENCODINGS if e in accepted and e in self.variants), "identity")
+        body, etag = self.variants[encoding]
+        headers = {"ETag": etag, "Cache-Control": PAGE_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(body, media_type=self.media_type, headers=headers)
+
+
+# Only files the catalogue links to are served (no path lookups from user input)
+_PDFS = frozenset(BOOK_MAP.values())
+
+
+def pdf_response(request: Request, name: str) -> Response:
+    """One book PDF: 404 unless listed in BOOK_MAP, 304 if the client's copy is current"""
+    if name not in _PDFS:
+        return Response("Not found", status_code=404, media_type="text/plain")
+    path = os.path.join(PDF_DIR, name)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return Response("Not found", status_code=404, media_type="text/plain")
+
+    # FileResponse derives ETag / Last-Modified from the stat; ranges and If-Range are its job
+    response = FileResponse(path, media_type="application/pdf", filename=name,
+                            stat_result=st, content_disposition_type="inline",
+                            headers={"Cache-Control": PDF_CACHE_CONTROL})
+    etag = response.headers["etag"]
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={
+            "ETag": etag, "Cache-Control": PDF_CACHE_CONTROL, "Last-Modified": response.headers["last-modified"]})
+    if PDF_ACCEL_PREFIX:
+        # nginx streams the file itself (sendfile, ranges); the app only checks the whitelist
+        return Response(headers={
+            "X-Accel-Redirect": f"{PDF_ACCEL_PREFIX.rstrip('/')}/{urllib.parse.quote(name)}",
+            "Content-Type": "application/pdf", "Cache-Control": PDF_CACHE_CONTROL, "ETag": etag})
+    return response
@@ -0,0 +1,227 @@
+"""
+CPS Wisdom Bot - TTS Audio Cache
+- Fixed phrases from the agent instructions are pre-rendered once and kept on disk
+- Sentences spoken repeatedly are recorded on their next synthesis
+- Cached PCM is played directly; the wrapped TTS is never called for it
+Audio is stored as raw 16-bit PCM keyed by (voice, model, sample rate, text).
+"""
+
+import asyncio
+import hashlib
+import os
+from collections import Counter, OrderedDict
+from typing import Optional
+
+from livekit.agents import APIConnectOptions, tokenize, tts, utils
+from livekit.agents.types import DEFAULT_API_CONNECT_OPTIONS
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "tts_cache")
+TTS_CACHE_MAX_MB = float(os.getenv("TTS_CACHE_MAX_MB", "64"))
+# Record a sentence's audio once it has been synthesized this many times
+TTS_CACHE_HOT_AFTER = int(os.getenv("TTS_CACHE_HOT_AFTER", "2"))
+
+# Phrases the agent instructions make it say constantly
+FIXED_PHRASES = [
+    "Peace be upon you. How can I help?",
+    "Let me check that for you.",
+    "This isn't covered in my library.",
+]
+
+
+def _sentences(text: str) -> list:
+    # The session's stream adapter may hand the TTS whole phrases or single sentences
+    pieces = tokenize.blingfire.SentenceTokenizer(min_sentence_len=1).tokenize(text)
+    return list(dict.fromkeys([text] + pieces))
+
+
+class CachedTTS(tts.TTS):
+    """
+    Wraps a non-streaming TTS. synthesize() replays cached PCM when the exact
+    text has been rendered before, otherwise delegates (recording hot sentences).
+    """
+
+    def __init__(self, inner: tts.TTS, *, voice: str, cache_dir: str = TTS_CACHE_DIR,
+                 max_mb: float = TTS_CACHE_MAX_MB, hot_after: int = TTS_CACHE_HOT_AFTER):
+        super().__init__(
+            capabilities=tts.TTSCapabilities(streaming=False),
+            sample_rate=inner.sample_rate,
+            num_channels=inner.num_channels,
+        )
+        self._inner = inner
+        self._voice = voice
+        self._cache_dir = cache_dir
+        self._max_bytes = int(max_mb * 1024 * 1024)
+        self._hot_after = hot_after
+        self._audio: "OrderedDict[str, bytes]" = OrderedDict()  # key -> PCM, LRU order
+        self._pinned: set = set()
+        self._mem_bytes = 0
+        self._counts: Counter = Counter()
+        self._pending_writes: set = set()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._on_disk = {
+            name[:-4]: os.path.getsize(os.path.join(cache_dir, name))
+            for name in os.listdir(cache_dir) if name.endswith(".pcm")
+        }
+
+    @property
+    def model(self) -> str:
+        return self._inner.model
+
+    @property
+    def provider(self) -> str:
+        return self._inner.provider
+
+    def _key(self, text: str) -> str:
+        ident = f"{self._voice}|{self._inner.model}|{self.sample_rate}|{' '.join(text.split())}"
+        return hashlib.sha1(ident.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._cache_dir, f"{key}.pcm")
+
+    def _lookup(self, key: str) -> Optional[bytes]:
+        pcm = self._audio.get(key)
+        if pcm is not None:
+            self._audio.move_to_end(key)
+            return pcm
+        if key in self._on_disk:
+            try:
+                with open(self._path(key), "rb") as f:
+                    pcm = f.read()
+            except OSError:
+                self._on_disk.pop(key, None)
+                return None
+            self._remember(key, pcm)
+            return pcm
+        return None
+
+    def _remember(self, key: str, pcm: bytes, pinned: bool = False):
+        if key in self._audio:
+            self._mem_bytes -= len(self._audio[key])
+        self._audio[key] = pcm
+        self._mem_bytes += len(pcm)
+        if pinned:
+            self._pinned.add(key)
+        # Evict least recently played audio, never the fixed phrases
+        for old in list(self._audio):
+            if self._mem_bytes <= self._max_bytes:
+                break
+            if old in self._pinned or old == key:
+                continue
+            self._mem_bytes -= len(self._audio.pop(old))
+
+    def store(self, text: str, pcm: bytes, pinned: bool = False):
+        """Keep audio in memory and persist it for later worker processes"""
+        if not pcm:
+            return
+        key = self._key(text)
+        self._remember(key, pcm, pinned)
+        if key in self._on_disk or key in self._pending_writes:
+            return
+        if not pinned and sum(self._on_disk.values()) + len(pcm) > self._max_bytes:
+            return
+        self._pending_writes.add(key)
+        task = asyncio.get_running_loop().create_task(asyncio.to_thread(self._write, key, pcm))
+        task.add_done_callback(lambda _: self._pending_writes.discard(key))
+
+    def _write(self, key: str, pcm: bytes):
+        # Idle job processes pre-render the same phrases at once: each writes its own temp file
+        tmp = f"{self._path(key)}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(pcm)
+            os.replace(tmp, self._path(key))
+        except OSError as e:
+            print(f"⚠️ TTS cache write failed for {key}: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        self._on_disk[key] = len(pcm)
+
+    def preload(self, phrases=FIXED_PHRASES) -> int:
+        """Pin fixed phrases already on disk into memory. Synchronous, so it can run in prewarm."""
+        loaded = 0
+        for phrase in phrases:
+            for text in _sentences(phrase):
+                key = self._key(text)
+                if self._lookup(key) is not None:
+                    self._pinned.add(key)
+                    loaded += 1
+        return loaded
+
+    async def prerender(self, phrases=FIXED_PHRASES):
+        """Render fixed phrases (and their sentences) that aren't cached yet"""
+        for phrase in phrases:
+            for text in _sentences(phrase):
+                key = self._key(text)
+                if self._lookup(key) is not None:
+                    self._pinned.add(key)
+                    continue
+                try:
+                    frame = await self._inner.synthesize(text).collect()
+                except Exception as e:
+                    print(f"⚠️ TTS pre-render failed for '{text}': {e}")
+                    continue
+                self.store(text, frame.data.tobytes(), pinned=True)
+                print(f"🔊 Pre-rendered: {text}")
+
+    def synthesize(
+        self, text: str, *, conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS
+    ) -> tts.ChunkedStream:
+        key = self._key(text)
+        pcm = self._lookup(key)
+        if pcm is not None:
+            return _CachedStream(tts=self, input_text=text, conn_options=conn_options, pcm=pcm)
+        self._counts[key] += 1
+        record = self._counts[key] >= self._hot_after
+        return _RecordingStream(tts=self, input_text=text, conn_options=conn_options, record=record)
+
+    def prewarm(self) -> None:
+        self._inner.prewarm()
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+
+class _CachedStream(tts.ChunkedStream):
+    def __init__(self, *, tts: CachedTTS, input_text: str, conn_options: APIConnectOptions, pcm: bytes):
+        super().__init__(tts=tts, input_text=input_text, conn_options=conn_options)
+        self._pcm = pcm
+
+    async def _run(self, output_emitter: tts.AudioEmitter) -> None:
+        output_emitter.initialize(
+            request_id=utils.shortuuid(),
+            sample_rate=self._tts.sample_rate,
+            num_channels=self._tts.num_channels,
+            mime_type="audio/pcm",
+        )
+        output_emitter.push(self._pcm)
+        output_emitter.flush()
+
+
+class _RecordingStream(tts.ChunkedStream):
+    def __init__(self, *, tts: CachedTTS, input_text: str, conn_options: APIConnectOptions, record: bool):
+        super().__init__(tts=tts, input_text=input_text, conn_options=conn_options)
+        self._cached_tts = tts
+        self._record = record
+
+    async def _run(self, output_emitter: tts.AudioEmitter) -> None:
+        output_emitter.initialize(
+            request_id=utils.shortuuid(),
+            sample_rate=self._tts.sample_rate,
+            num_channels=self._tts.num_channels,
+            mime_type="audio/pcm",
+        )
+        chunks = []
+        # Retries happen in this (outer) stream; don't multiply them in the inner one
+        inner_options = APIConnectOptions(max_retry=0, timeout=self._conn_options.timeout)
+        async with self._cached_tts._inner.synthesize(self.input_text, conn_options=inner_options) as stream:
+            async for ev in stream:
+                data = ev.frame.data.tobytes()
+                output_emitter.push(data)
+                if self._record:
+                    chunks.append(data)
+        output_emitter.flush()
+        if self._record:
+            self._cached_tts.store(self.input_text, b"".join(chunks))
@@ -0,0 +1,160 @@
+"""
+CPS Wisdom Bot - LightRAG Upstream Protection
+- Bounded concurrency: UPSTREAM_CONCURRENCY calls run, UPSTREAM_QUEUE more wait,
+  anything beyond that is rejected at once instead of piling up
+- Deadlines: time spent queueing comes out of the caller's timeout
+- Adaptive timeouts: a call gets TIMEOUT_FACTOR x the recent p95 latency of its mode,
+  not a fixed minute; timed-out calls count at their timeout, so the estimate grows
+  when LightRAG slows down
+- Circuit breaker: after BREAKER_FAILURES consecutive failures calls fail fast for
+  BREAKER_COOLDOWN seconds, then a single probe decides whether LightRAG is back
+Rejected calls degrade to stale cache entries or local book passages (answers.py).
+"""
+
+import asyncio
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+
+from metrics import LIGHTRAG_CIRCUIT, LIGHTRAG_QUEUED, LIGHTRAG_REJECTED
+
+UPSTREAM_CONCURRENCY = int(os.getenv("LIGHTRAG_CONCURRENCY", "16"))
+UPSTREAM_QUEUE = int(os.getenv("LIGHTRAG_QUEUE", "64"))
+
+# Adaptive timeout: TIMEOUT_FACTOR x p95 of the last LATENCY_WINDOW calls in the same
+# mode, at least TIMEOUT_MIN and never past the caller's deadline
+TIMEOUT_FACTOR = float(os.getenv("LIGHTRAG_TIMEOUT_FACTOR", "3"))
+TIMEOUT_MIN = float(os.getenv("LIGHTRAG_TIMEOUT_MIN", "5"))
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+
+BREAKER_FAILURES = int(os.getenv("LIGHTRAG_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("LIGHTRAG_BREAKER_COOLDOWN", "15"))
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+# cps_lightrag_circuit_state values
+_STATE_VALUE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class Rejected(Exception):
+    """The call was never made: queue full, deadline spent queueing, or circuit open"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def _reject(reason: str) -> Rejected:
+    LIGHTRAG_REJECTED.labels(reason).inc()
+    return Rejected(reason)
+
+
+class UpstreamGuard:
+    """Admission control, adaptive timeouts and circuit breaker for one upstream (per process)"""
+
+    def __init__(self, concurrency: int = UPSTREAM_CONCURRENCY, queue: int = UPSTREAM_QUEUE,
+                 failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN):
+        self.concurrency = concurrency
+        self.max_queue = queue
+        self.max_failures = failures
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self._slots = asyncio.Semaphore(concurrency)
+        self._waiting = 0
+        self._latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))  # mode -> seconds
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def observe(self, mode: str, seconds: float):
+        """
+        Record the latency of a call in `mode`: its duration if it answered, its
+        timeout if it timed out (a lower bound, so slow spells raise the estimate)
+        """
+        self._latencies[mode].append(seconds)
+
+    def timeout(self, mode: str, remaining: float) -> float:
+        """Timeout for a call in `mode` with `remaining` seconds left before the caller's deadline"""
+        samples = self._latencies.get(mode)
+        if samples is None or len(samples) < LATENCY_MIN_SAMPLES:
+            return remaining
+        recent = sorted(samples)
+        p95 = recent[int(len(recent) * 0.95) - 1]
+        return min(remaining, max(TIMEOUT_MIN, p95 * TIMEOUT_FACTOR))
+
+    def _set_state(self, state: str):
+        self.state = state
+        LIGHTRAG_CIRCUIT.set(_STATE_VALUE[state])
+
+    def _admit(self) -> bool:
+        """Raise if the circuit is open; True if this call is the half-open probe"""
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.cooldown:
+                raise _reject("circuit_open")
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probing:
+                raise _reject("circuit_open")
+            self._probing = True
+            return True
+        return False
+
+    async def _acquire(self, deadline: float):
+        if not self._slots.locked():
+            await self._slots.acquire()
+            return
+        if self._waiting >= self.max_queue:
+            raise _reject("queue_full")
+        self._waiting += 1
+        LIGHTRAG_QUEUED.inc()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            raise _reject("deadline") from None
+        finally:
+            self._waiting -= 1
+            LIGHTRAG_QUEUED.dec()
+
+    def _success(self):
+        self._failures = 0
+        if self.state != CLOSED:
+            print("🔌 LightRAG circuit closed: answering again")
+            self._set_state(CLOSED)
+
+    def _failure(self):
+        self._failures += 1
+        if self.state == HALF_OPEN or self._failures >= self.max_failures:
+            if self.state != OPEN:
+                print(f"🔌 LightRAG circuit OPEN after {self._failures} failures, "
+                      f"failing fast for {self.cooldown:g}s")
+            self._opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    @asynccontextmanager
+    async def slot(self, timeout: float):
+        """
+        Admit one upstream call that must finish within `timeout` seconds.
+        Yields the seconds left once a slot is free; raises Rejected if the call
+        can't be made. An exception from the body counts as an upstream failure;
+        cancellation counts as nothing.
+        """
+        deadline = time.monotonic() + timeout
+        probe = self._admit()
+        try:
+            await self._acquire(deadline)
+            try:
+                yield max(0.0, deadline - time.monotonic())
+            finally:
+                self._slots.release()
+        except Rejected:
+            raise
+        except Exception:
+            self._failure()
+            raise
+        else:
+            self._success()
+        finally:
+            if probe:
+                self._probing = False
+
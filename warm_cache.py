@@ -0,0 +1,116 @@
+"""
+CPS Wisdom Bot - Cache Warming Job
+Replays a question list or query log against LightRAG with bounded concurrency
+and pre-populates the shared answer cache for every mode (text + voice).
+
+Usage:
+    python warm_cache.py questions.txt [more.txt queries.jsonl ...]
+        [--modes mix naive] [--concurrency 8] [--force]
+
+Input: one question per line (# comments allowed), or JSON lines with a
+"question" or "query" field. Run it after bumping CORPUS_VERSION.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from answers import CORPUS_VERSION, MODES, answer_cache, cache_key, fetch_answer, query_index, seed_query_index
+from cache import close_redis, get_redis
+from lightrag_client import close_client, LightRAGError
+
+
+def read_questions(paths) -> list:
+    """Questions from text/JSONL files, in order, exact duplicates removed"""
+    questions = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if line.startswith("{"):
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    line = (record.get("question") or record.get("query") or "").strip()
+                    if not line:
+                        continue
+                questions.append(line)
+    return list(dict.fromkeys(questions))
+
+
+async def warm(questions, modes, concurrency: int, force: bool, timeout: float) -> dict:
+    stats = {"warmed": 0, "cached": 0, "failed": 0}
+    sem = asyncio.Semaphore(concurrency)
+
+    # Paraphrases collapse onto one canonical question, warmed once per mode;
+    # seeded first so the keys match the ones the server and agent look up
+    await seed_query_index()
+    canonical = {}
+    for q in questions:
+        canonical.setdefault(query_index.canonicalize(q), q)
+
+    async def warm_one(canon: str, question: str, mode: str):
+        key = cache_key(canon, mode)
+        if not force:
+            entry = await answer_cache.get(key)
+            if entry is not None and not answer_cache.is_stale(entry):
+                stats["cached"] += 1
+                return
+        async with sem:
+            try:
+                value = await fetch_answer(question, mode, timeout, canon)
+            except LightRAGError as e:
+                stats["failed"] += 1
+                print(f"❌ [{mode}] {question[:50]}... {e}")
+                return
+        await answer_cache.set(key, value)
+        stats["warmed"] += 1
+        print(f"💾 [{mode}] {question[:50]}...")
+
+    await asyncio.gather(*(
+        warm_one(canon, question, mode)
+        for canon, question in canonical.items()
+        for mode in modes
+    ))
+    stats["questions"] = len(canonical)
+    return stats
+
+
+async def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Pre-populate the shared LightRAG answer cache")
+    parser.add_argument("files", nargs="+", help="question lists (.txt) or query logs (.jsonl)")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), help=f"LightRAG modes (default: {' '.join(MODES)})")
+    parser.add_argument("--concurrency", type=int, default=8, help="max in-flight LightRAG queries")
+    parser.add_argument("--force", action="store_true", help="re-query even if a fresh answer is cached")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-query timeout in seconds")
+    args = parser.parse_args(argv)
+
+    try:
+        if await get_redis() is None:
+            print("❌ Redis unavailable - nothing to warm into.")
+            return 1
+
+        questions = read_questions(args.files)
+        print(f"🔥 Warming {len(questions)} questions x {len(args.modes)} modes "
+              f"(corpus v{CORPUS_VERSION}, concurrency {args.concurrency})")
+        start = time.monotonic()
+        stats = await warm(questions, args.modes, max(1, args.concurrency), args.force, args.timeout)
+        print(f"✅ Done in {time.monotonic() - start:.1f}s: {stats['questions']} unique questions, "
+              f"{stats['warmed']} warmed, {stats['cached']} already cached, {stats['failed']} failed")
+        return 0 if stats["failed"] == 0 else 2
+    finally:
+        await close_client()
+        await close_redis()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))